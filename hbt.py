@@ -13,21 +13,106 @@ Licensed under CC BY 4.0 (https://creativecommons.org/licenses/by/4.0/)
 __version__ = "1.0.0"
 __author__ = "Максим Кузьминский <i@m-letto.ru>"
 
+import atexit
+import gzip
+import heapq
 import json
 import os
+import random
 import shutil
 import argparse
 import sys
-import uuid
+import time
 import hashlib
 import tempfile
+import weakref
+from collections import Counter
 from datetime import datetime
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any
 from enum import Enum
+from operator import itemgetter
 from contextlib import contextmanager
 from pathlib import Path
 
+# Опциональный ускоритель JSON (Rust/SIMD-реализация): при наличии orjson
+# (де)сериализация быстрее в разы, без него прозрачно работаем на stdlib.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj: Any, default=None) -> bytes:
+    """Сериализует объект в JSON-байты (orjson при наличии, иначе stdlib)
+
+    default — хук для несериализуемых типов (одинаково поддерживается
+    orjson и stdlib json).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                obj,
+                default=default,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            # orjson ограничивает вложенность контейнеров (~254 уровней) —
+            # глубокие деревья дожимает stdlib-кодировщик ниже
+            pass
+    try:
+        return json.dumps(obj, indent=2, ensure_ascii=False,
+                          default=default).encode("utf-8")
+    except RecursionError:
+        # Кодировщик stdlib тоже рекурсивен; для совсем глубоких деревьев
+        # поднимаем лимит ступенями и возвращаем его на место
+        limit = sys.getrecursionlimit()
+        try:
+            for factor in (8, 64):
+                sys.setrecursionlimit(limit * factor)
+                try:
+                    return json.dumps(obj, indent=2, ensure_ascii=False,
+                                      default=default).encode("utf-8")
+                except RecursionError:
+                    continue
+            raise
+        finally:
+            sys.setrecursionlimit(limit)
+
+
+def _loads(buf) -> Any:
+    """Разбирает JSON из байтов или строки"""
+    if orjson is not None:
+        try:
+            return orjson.loads(buf)
+        except orjson.JSONDecodeError:
+            # orjson ограничивает глубину и при разборе — глубокие деревья
+            # дочитывает stdlib; по-настоящему битый JSON упадёт и там
+            pass
+    try:
+        return json.loads(buf)
+    except RecursionError:
+        # Декодер stdlib тоже упирается в лимит рекурсии — поднимаем его
+        # теми же ступенями, что и _dumps
+        limit = sys.getrecursionlimit()
+        try:
+            for factor in (8, 64):
+                sys.setrecursionlimit(limit * factor)
+                try:
+                    return json.loads(buf)
+                except RecursionError:
+                    continue
+            raise
+        finally:
+            sys.setrecursionlimit(limit)
+
+
+def _dumps_line(obj: Any) -> bytes:
+    """Сериализует объект в компактный однострочный JSON (для NDJSON)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 
 # ============================================================================
 # ИСКЛЮЧЕНИЯ
@@ -91,7 +176,14 @@ class ActionType(Enum):
     TAG_ADD = "tag_add"
     TAG_REMOVE = "tag_remove"
     ALIAS_SET = "alias_set"
+    IMPORT = "import"
+
 
+# Строковые значения статусов, вынесенные из Enum: горячие сравнения вида
+# `node.status == _STATUS_LOCKED` не трогают атрибуты Enum на каждом вызове
+_STATUS_LOCKED = NodeStatus.LOCKED.value
+_STATUS_EDITABLE = NodeStatus.EDITABLE.value
+_PROGRESS_DONE = TaskProgress.DONE.value
 
 # Иконки для отображения
 PROGRESS_ICONS = {
@@ -106,12 +198,42 @@ STATUS_ICONS = {
     NodeStatus.EDITABLE: "✍️",
 }
 
+# Те же иконки по строковым значениям: пути отрисовки обходятся без
+# конструирования Enum на каждый узел
+PROGRESS_ICONS_BY_STR = {p.value: icon for p, icon in PROGRESS_ICONS.items()}
+STATUS_ICONS_BY_STR = {s.value: icon for s, icon in STATUS_ICONS.items()}
+
+# Множества допустимых строковых значений — валидация без конструирования
+# Enum и перехвата ValueError на каждый вызов
+_STATUS_VALUES = frozenset(s.value for s in NodeStatus)
+_PROGRESS_VALUES = frozenset(p.value for p in TaskProgress)
+
+# HBT_SKIP_FSYNC=1 отключает fsync при сохранении — для тестов и скриптов,
+# где долговечность при сбое питания не нужна. Читается один раз при импорте
+_SKIP_FSYNC = os.environ.get("HBT_SKIP_FSYNC") == "1"
+
+# ANSI-коды отрисовки дерева (id, lock, edit, tag, alias, dim, end) —
+# кортеж выбирается один раз на вызов, а не собирается по-полю
+_ANSI_ON = ("\033[94m", "\033[91m", "\033[92m", "\033[93m", "\033[95m",
+            "\033[90m", "\033[0m")
+_ANSI_OFF = ("",) * 7
+
 
 # ============================================================================
 # МОДЕЛИ ДАННЫХ
 # ============================================================================
 
-@dataclass
+def _history_checksum(prev: str, action: str, node_id: str, text: str) -> str:
+    """Цепная контрольная сумма записи истории: включает хэш предыдущей
+    записи, так что подмена любой строки ломает все последующие суммы.
+    Кэшировать бессмысленно — prev делает каждый вход уникальным"""
+    data = f"{prev}{action}{node_id}{text}"
+    # blake2b быстрее SHA-256, а криптостойкость здесь не нужна —
+    # это лишь отпечаток записи истории
+    return hashlib.blake2b(data.encode(), digest_size=6).hexdigest()
+
+
+@dataclass(slots=True)
 class HistoryEntry:
     """Запись в истории изменений"""
     timestamp: str
@@ -122,11 +244,49 @@ class HistoryEntry:
     
     def __post_init__(self):
         if not self.checksum:
-            data = f"{self.timestamp}{self.action}{self.node_id}{self.text}"
-            self.checksum = hashlib.sha256(data.encode()).hexdigest()[:12]
+            # Одиночная запись вне цепочки — в роли prev её метка времени
+            self.checksum = _history_checksum(
+                self.timestamp, self.action, self.node_id, self.text
+            )
+
+
+# Кэш метки времени: в пределах ~1 мс все операции получают одну и ту же
+# ISO-строку — пакетные изменения не форматируют datetime на каждый узел
+_NOW_CACHE = [0.0, ""]
+
+
+_LOG_TS_CACHE: list = [0, ""]
+
 
+def _log_timestamp() -> str:
+    """Метка времени для истории (кэш с окном 1 с — точность формата)"""
+    t = int(time.time())
+    if t != _LOG_TS_CACHE[0]:
+        _LOG_TS_CACHE[0] = t
+        _LOG_TS_CACHE[1] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return _LOG_TS_CACHE[1]
 
-@dataclass 
+
+def _now_iso() -> str:
+    """Текущее время в ISO-формате (кэш с окном 1 мс)"""
+    t = time.monotonic()
+    if t - _NOW_CACHE[0] > 0.001 or not _NOW_CACHE[1]:
+        _NOW_CACHE[0] = t
+        _NOW_CACHE[1] = datetime.now().isoformat()
+    return _NOW_CACHE[1]
+
+
+# Генератор ID: один запрос энтропии ОС на процесс вместо os.urandom(16)
+# на каждый uuid4 при создании узла
+_ID_RNG = random.Random()
+
+# Поколение дерева: растёт при любом изменении статуса/родителя узла и при
+# создании новых узлов. Используется для инвалидации кэшей проверок
+# заблокированных потомков (см. Node.has_locked_children).
+_tree_version = 0
+
+
+@dataclass(slots=True)
 class Node:
     """Узел дерева задач"""
     id: str
@@ -140,60 +300,181 @@ class Node:
     created_at: str = ""
     updated_at: str = ""
     parent_id: Optional[str] = None
-    
+    # Кэши (не сериализуются): проверка заблокированных потомков и
+    # готовый словарь для to_dict, оба привязаны к поколению дерева
+    _locked_cache_version: int = field(default=-1, init=False, repr=False, compare=False)
+    _locked_cache: bool = field(default=False, init=False, repr=False, compare=False)
+    _dict_cache_version: int = field(default=-1, init=False, repr=False, compare=False)
+    _cached_dict: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name, value):
+        # Любая мутация сериализуемого поля делает кэши всех узлов
+        # устаревшими; все пути изменения в драйвере проставляют updated_at,
+        # так что инвалидация срабатывает и для косвенных мутаций списков
+        if not name.startswith("_"):
+            global _tree_version
+            _tree_version += 1
+        object.__setattr__(self, name, value)
+
     def __post_init__(self):
-        now = datetime.now().isoformat()
-        if not self.created_at:
-            self.created_at = now
-        if not self.updated_at:
-            self.updated_at = now
+        # На пути загрузки метки времени уже есть — не трогаем datetime вовсе
+        if not self.created_at or not self.updated_at:
+            now = _now_iso()
+            if not self.created_at:
+                self.created_at = now
+            if not self.updated_at:
+                self.updated_at = now
         # Конвертируем children из dict в Node если нужно
         if self.children and len(self.children) > 0 and isinstance(self.children[0], dict):
             self.children = [Node(**c) for c in self.children]
     
     def to_dict(self) -> Dict[str, Any]:
-        """Сериализация в словарь"""
-        return {
-            "id": self.id,
-            "text": self.text,
-            "status": self.status,
-            "progress": self.progress,
-            "visible": self.visible,
-            "children": [c.to_dict() for c in self.children],
-            "tags": self.tags,
-            "alias": self.alias,
-            "created_at": self.created_at,
-            "updated_at": self.updated_at,
-            "parent_id": self.parent_id,
-        }
-    
+        """Сериализация в словарь (итеративно, с кэшем по поколению дерева).
+
+        Возвращаемый словарь кэшируется — вызывающий код не должен его
+        мутировать.
+        """
+        if self._dict_cache_version == _tree_version and self._cached_dict is not None:
+            return self._cached_dict
+        result: Dict[str, Any] = {}
+        stack = [(self, result)]
+        built = []
+        while stack:
+            node, out = stack.pop()
+            built.append((node, out))
+            out["id"] = node.id
+            out["text"] = node.text
+            out["status"] = node.status
+            out["progress"] = node.progress
+            out["visible"] = node.visible
+            children_out: List[Dict[str, Any]] = []
+            out["children"] = children_out
+            out["tags"] = node.tags
+            out["alias"] = node.alias
+            out["created_at"] = node.created_at
+            out["updated_at"] = node.updated_at
+            out["parent_id"] = node.parent_id
+            for child in node.children:
+                # Чистые поддеревья переиспользуют готовый словарь
+                if child._dict_cache_version == _tree_version and child._cached_dict is not None:
+                    children_out.append(child._cached_dict)
+                else:
+                    child_out: Dict[str, Any] = {}
+                    children_out.append(child_out)
+                    stack.append((child, child_out))
+        for node, out in built:
+            node._cached_dict = out
+            node._dict_cache_version = _tree_version
+        return result
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Node':
-        """Десериализация из словаря"""
-        # Копируем, чтобы не мутировать входные данные
-        data = data.copy()
-        children_data = data.pop('children', [])
-        node = cls(**data)
-        node.children = [cls.from_dict(c) for c in children_data]
+        """Десериализация из словаря (итеративно — без рекурсии по детям)"""
+        root = cls._from_fields(data)
+        stack = [(data.get('children') or (), root.children)]
+        while stack:
+            child_dicts, out_list = stack.pop()
+            # Размер известен заранее — выделяем список один раз без доращивания
+            out_list[:] = child_dicts
+            for i, child_data in enumerate(child_dicts):
+                node = cls._from_fields(child_data)
+                out_list[i] = node
+                stack.append((child_data.get('children') or (), node.children))
+        return root
+
+    @classmethod
+    def _from_fields(cls, data: Dict[str, Any]) -> 'Node':
+        """Создаёт узел из полей словаря без копирования и без children
+
+        Строки status/progress/тегов интернируются: значений всего несколько,
+        а sys.intern сводит их к одному объекту на значение — сравнение
+        становится сравнением указателей, память не дублируется на узел.
+        """
+        tags = data.get('tags')
+        return cls(
+            id=data['id'],
+            text=data['text'],
+            status=sys.intern(data.get('status', 'editable')),
+            progress=sys.intern(data.get('progress', 'todo')),
+            visible=data.get('visible', True),
+            tags=[sys.intern(t) for t in tags] if tags else [],
+            alias=data.get('alias'),
+            created_at=data.get('created_at', ''),
+            updated_at=data.get('updated_at', ''),
+            parent_id=data.get('parent_id'),
+        )
+
+    @classmethod
+    def _fast_from_dict(cls, data: Dict[str, Any]) -> 'Node':
+        """Создаёт узел на пути загрузки, минуя __init__ и __setattr__
+
+        Прямое заполнение слотов через object.__setattr__ обходит и
+        kwargs-диспетчеризацию dataclass-конструктора, и инкремент
+        _tree_version на каждое поле — загрузка не мутация дерева.
+        children, как и в _from_fields, не трогаются (их кладёт вызывающий).
+        """
+        node = object.__new__(cls)
+        set_ = object.__setattr__
+        get = data.get
+        tags = get('tags')
+        created_at = get('created_at', '')
+        updated_at = get('updated_at', '')
+        if not created_at or not updated_at:
+            now = _now_iso()
+            created_at = created_at or now
+            updated_at = updated_at or now
+        set_(node, 'id', data['id'])
+        set_(node, 'text', data['text'])
+        set_(node, 'status', sys.intern(get('status', 'editable')))
+        set_(node, 'progress', sys.intern(get('progress', 'todo')))
+        set_(node, 'visible', get('visible', True))
+        set_(node, 'children', [])
+        set_(node, 'tags', [sys.intern(t) for t in tags] if tags else [])
+        set_(node, 'alias', get('alias'))
+        set_(node, 'created_at', created_at)
+        set_(node, 'updated_at', updated_at)
+        set_(node, 'parent_id', get('parent_id'))
+        # Слоты кэшей: без них object.__new__ оставит их неинициализированными
+        set_(node, '_locked_cache_version', -1)
+        set_(node, '_locked_cache', False)
+        set_(node, '_dict_cache_version', -1)
+        set_(node, '_cached_dict', None)
         return node
-    
+
     def is_locked(self) -> bool:
-        return self.status == NodeStatus.LOCKED.value
+        return self.status == _STATUS_LOCKED
     
     def has_locked_children(self) -> bool:
-        """Проверяет наличие заблокированных потомков"""
-        for child in self.children:
-            if child.is_locked() or child.has_locked_children():
-                return True
-        return False
-    
+        """Проверяет наличие заблокированных потомков (с кэшем по поколению)"""
+        if self._locked_cache_version == _tree_version:
+            return self._locked_cache
+        # Итеративный DFS с выходом на первом заблокированном потомке —
+        # без рекурсии глубина дерева не ограничена лимитом стека
+        result = False
+        stack = list(self.children)
+        while stack:
+            node = stack.pop()
+            if node.status == _STATUS_LOCKED:
+                result = True
+                break
+            stack.extend(node.children)
+        self._locked_cache = result
+        self._locked_cache_version = _tree_version
+        return result
+
     def get_locked_children_ids(self) -> List[str]:
         """Возвращает ID всех заблокированных потомков"""
+        # Спускаемся только в поддеревья, где заблокированные точно есть
+        if not self.has_locked_children():
+            return []
         locked = []
-        for child in self.children:
-            if child.is_locked():
-                locked.append(child.id)
-            locked.extend(child.get_locked_children_ids())
+        # Стек в обратном порядке сохраняет прежний (префиксный) порядок обхода
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if node.status == _STATUS_LOCKED:
+                locked.append(node.id)
+            stack.extend(reversed(node.children))
         return locked
 
 
@@ -205,19 +486,54 @@ class ProjectConfig:
     auto_backup: bool = True
     max_snapshots: int = 100
     default_status: str = "editable"
-    
+    # Троттлинг автоснапшотов: не чаще одного на интервал ИЛИ на N операций
+    snap_interval_s: float = 5.0
+    snap_every_n: int = 20
+
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-    
+        # Плоская структура — литерал словаря дешевле рефлексии asdict
+        return {
+            "name": self.name,
+            "version": self.version,
+            "auto_backup": self.auto_backup,
+            "max_snapshots": self.max_snapshots,
+            "default_status": self.default_status,
+            "snap_interval_s": self.snap_interval_s,
+            "snap_every_n": self.snap_every_n,
+        }
+
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'ProjectConfig':
-        return cls(**{k: v for k, v in data.items() if k in cls.__dataclass_fields__})
+        return cls(
+            name=data.get("name", "New HBT Project"),
+            version=data.get("version", "1.0.0"),
+            auto_backup=data.get("auto_backup", True),
+            max_snapshots=data.get("max_snapshots", 100),
+            default_status=data.get("default_status", "editable"),
+            snap_interval_s=data.get("snap_interval_s", 5.0),
+            snap_every_n=data.get("snap_every_n", 20),
+        )
 
 
 # ============================================================================
 # ОСНОВНОЙ ДРАЙВЕР
 # ============================================================================
 
+# Живые драйверы для страховочного сброса при выходе процесса. WeakSet не
+# продлевает жизнь объектов: отпущенный драйвер собирается GC, а не висит
+# в atexit-замыкании до конца процесса
+_LIVE_DRIVERS: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def _flush_live_drivers() -> None:
+    """atexit-страховка: дописывает несохранённое у всех живых драйверов"""
+    for driver in list(_LIVE_DRIVERS):
+        driver._safe_flush()
+
+
+atexit.register(_flush_live_drivers)
+
+
 class HBTDriver:
     """
     Production-grade драйвер для управления иерархическими задачами.
@@ -227,15 +543,41 @@ class HBTDriver:
     - Атомарные операции с файловой блокировкой
     - Защита locked-узлов на всех уровнях
     - Полная история с контрольными суммами
+
+    Инвариант: _index (id -> Node) и _alias_index (alias -> id) всегда
+    синхронизированы с деревом — все операции поиска идут через них за O(1),
+    линейных обходов дерева для разрешения идентификаторов нет.
     """
     
     def __init__(self, filename: str = "tasks.json"):
         self.db_path = Path.cwd() / filename
+        self.hist_path = self.db_path.with_suffix('.history.jsonl')
         self.snap_dir = Path.cwd() / ".hbt_history"
         self._data: Optional[Dict[str, Any]] = None
         self._index: Dict[str, Node] = {}  # Кэш для быстрого поиска
         self._alias_index: Dict[str, str] = {}  # alias -> id
+        # Объединённый словарь id|alias -> Node: разрешение идентификатора
+        # за один hash-пробинг. id имеет приоритет над совпадающим alias
+        self._lookup: Dict[str, Node] = {}
+        self._roots: Dict[str, Node] = {}  # id -> корневой узел (в порядке дерева)
+        self._text_lower: Dict[str, str] = {}  # id -> текст в нижнем регистре
+        self._tag_index: Dict[str, set] = {}  # tag -> {id} (инвертированный индекс)
+        self._ancestor_cache: Dict[str, List[Node]] = {}  # id -> цепочка предков
+        # Живые счётчики статистики — get_stats не сканирует дерево
+        self._visible_count = 0
+        self._locked_count = 0
+        self._progress_counts: Counter = Counter()
+        self._dirty = False  # Есть ли несохранённые изменения в памяти
+        self._batch_depth = 0  # Глубина вложенных batch()-блоков
+        self._hist_fp = None  # Ленивый append-дескриптор файла истории
+        self._config_cache: Optional[ProjectConfig] = None
+        self._last_snap_time = 0.0  # time.monotonic() последнего автоснапшота
+        self._ops_since_snap = 0  # Сохранений с момента последнего автоснапшота
+        # Хвост цепочки контрольных сумм истории; заполняется в _load
+        self._last_checksum: str = ""
         self._load()
+        # Страховка: несброшенные изменения пишутся при завершении процесса
+        _LIVE_DRIVERS.add(self)
     
     # ========================================================================
     # ЗАГРУЗКА / СОХРАНЕНИЕ
@@ -245,26 +587,49 @@ class HBTDriver:
         """Возвращает структуру данных по умолчанию"""
         return {
             "config": ProjectConfig().to_dict(),
-            "history": [],
             "tree": [],
             "schema_version": __version__,
         }
     
     def _load(self) -> None:
         """Загружает данные из файла"""
+        # _load вызывается и при restore_snapshot — производные от _data
+        # кэши (конфиг, хвост цепочки контрольных сумм) сбрасываются здесь,
+        # а не только в __init__
+        self._config_cache = None
         if not self.db_path.exists():
             self._data = self._get_default_data()
+            self._last_checksum = ""
             return
-        
+
         try:
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                raw_data = json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
+            # Читаем байты напрямую: _loads принимает bytes, текстовый слой io
+            # с декодированием здесь лишний
+            raw_data = _loads(self.db_path.read_bytes())
+        except (ValueError, IOError, RecursionError) as e:
             raise IntegrityError(f"Ошибка чтения базы данных: {e}")
         
         # Миграция старого формата
         self._data = self._migrate_data(raw_data)
+        # История живёт в append-only NDJSON-файле; записи из старых баз
+        # переносим туда один раз при загрузке
+        legacy_history = self._data.pop("history", None)
+        if legacy_history:
+            for entry in legacy_history:
+                self._append_history(entry)
         self._rebuild_index()
+        if not self._last_checksum:
+            # Хвост берём из файла только при первичной загрузке. При
+            # повторных (restore_snapshot) память новее снапшота: хвост
+            # отражает файл истории, который восстановление не трогает
+            self._last_checksum = self._data.get("last_checksum", "")
+        elif self._data.get("last_checksum") != self._last_checksum:
+            self._data["last_checksum"] = self._last_checksum
+        if legacy_history:
+            # База без поля history переписывается сразу — иначе каждая
+            # следующая загрузка мигрировала бы записи заново, дублируя их
+            self._dirty = True
+            self._flush()
     
     def _migrate_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Миграция данных из старого формата"""
@@ -284,8 +649,10 @@ class HBTDriver:
         return data
     
     def _migrate_nodes(self, nodes: List[Dict], parent_id: Optional[str] = None) -> None:
-        """Рекурсивная миграция узлов"""
-        for node in nodes:
+        """Миграция узлов (итеративно — глубина дерева не упирается в стек)"""
+        stack = [(node, parent_id) for node in reversed(nodes)]
+        while stack:
+            node, pid = stack.pop()
             # Если ID выглядит как позиционный (1.1.2), генерируем UUID
             old_id = node.get("id", "")
             if "." in old_id or old_id.isdigit():
@@ -293,51 +660,58 @@ class HBTDriver:
                 if not node.get("alias"):
                     node["alias"] = old_id
                 node["id"] = self._generate_id()
-            
+
             # Добавляем недостающие поля
             node.setdefault("tags", [])
             node.setdefault("alias", None)
-            node.setdefault("created_at", datetime.now().isoformat())
-            node.setdefault("updated_at", datetime.now().isoformat())
-            node.setdefault("parent_id", parent_id)
-            
-            self._migrate_nodes(node.get("children", []), node["id"])
+            node.setdefault("created_at", _now_iso())
+            node.setdefault("updated_at", _now_iso())
+            node.setdefault("parent_id", pid)
+
+            for child in reversed(node.get("children", [])):
+                stack.append((child, node["id"]))
     
     def _rebuild_index(self) -> None:
         """Перестраивает индексы для быстрого поиска"""
         self._index.clear()
         self._alias_index.clear()
-        
-        def index_node(node_data: Dict, parent_node: Optional[Node] = None) -> Node:
-            """Рекурсивно индексирует узлы, возвращая созданный Node"""
-            # Создаём узел БЕЗ рекурсивного создания детей
-            children_data = node_data.get("children", [])
-            
-            # Создаём копию данных без children
-            node_data_copy = {}
-            for k, v in node_data.items():
-                if k != "children":
-                    node_data_copy[k] = v
-            node_data_copy["children"] = []
-            
-            # ПРИНУДИТЕЛЬНО устанавливаем parent_id из структуры дерева
-            node_data_copy["parent_id"] = parent_node.id if parent_node else None
-            
-            node = Node.from_dict(node_data_copy)
-            
+        self._lookup.clear()
+        self._roots.clear()
+        self._text_lower.clear()
+        self._tag_index.clear()
+        self._ancestor_cache.clear()
+        self._visible_count = 0
+        self._locked_count = 0
+        self._progress_counts.clear()
+
+        # Итеративный preorder-обход без копий словарей: узел создаётся через
+        # _fast_from_dict (children не трогает), а parent_id ПРИНУДИТЕЛЬНО
+        # берётся из структуры дерева, как и раньше
+        stack = [(node_data, None)
+                 for node_data in reversed(self._data.get("tree", []))]
+        while stack:
+            node_data, parent = stack.pop()
+            node = Node._fast_from_dict(node_data)
+            object.__setattr__(node, 'parent_id', parent.id if parent else None)
+
             self._index[node.id] = node
+            self._lookup[node.id] = node
             if node.alias:
                 self._alias_index[node.alias] = node.id
-            
-            # Рекурсивно обрабатываем детей — передаём текущий node как родителя
-            for child_data in children_data:
-                child_node = index_node(child_data, node)
-                node.children.append(child_node)
-            
-            return node
-        
-        for node_data in self._data.get("tree", []):
-            index_node(node_data, None)
+                self._lookup.setdefault(node.alias, node)
+            self._text_lower[node.id] = node.text.lower()
+            for tag in node.tags:
+                self._tag_index.setdefault(tag, set()).add(node.id)
+            self._stats_add_node(node)
+            if parent is not None:
+                parent.children.append(node)
+            else:
+                self._roots[node.id] = node
+
+            children_data = node_data.get("children")
+            if children_data:
+                for child_data in reversed(children_data):
+                    stack.append((child_data, node))
     
     @contextmanager
     def _atomic_save(self):
@@ -353,6 +727,14 @@ class HBTDriver:
             yield temp_path
             # Атомарная замена
             temp_path.replace(self.db_path)
+            # Фиксируем и запись в каталоге — иначе rename может пропасть
+            # при сбое питания. Снапшоты — производные данные, их не fsync'аем
+            if not _SKIP_FSYNC and hasattr(os, 'O_DIRECTORY'):
+                dir_fd = os.open(self.db_path.parent, os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
         except Exception:
             temp_path.unlink(missing_ok=True)
             raise
@@ -363,34 +745,116 @@ class HBTDriver:
                 pass
     
     def _save(self, manual_name: Optional[str] = None) -> None:
+        """Помечает данные изменёнными и сбрасывает их на диск
+
+        Внутри batch()-блока запись откладывается до выхода из блока.
+        """
+        self._dirty = True
+        if self._batch_depth:
+            return
+        self._flush(manual_name)
+
+    @contextmanager
+    def batch(self):
+        """Группирует операции: один сброс на диск вместо одного на операцию
+
+        Пример: with driver.batch(): много add_node(...) — JSON-дамп, fsync
+        и снапшот выполняются один раз при выходе из блока.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._dirty:
+                self._flush()
+
+    def _safe_flush(self) -> None:
+        """Сброс для atexit — ошибки не должны маскировать выход процесса"""
+        try:
+            self._flush()
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """Сбрасывает несохранённое и освобождает ресурсы драйвера
+
+        Закрывает дескриптор файла истории и снимает драйвер со
+        страховочного atexit-сброса; после close() объект можно отпустить.
+        """
+        self._safe_flush()
+        if self._hist_fp is not None:
+            try:
+                self._hist_fp.close()
+            except OSError:
+                pass
+            self._hist_fp = None
+        _LIVE_DRIVERS.discard(self)
+
+    def _flush(self, manual_name: Optional[str] = None) -> None:
         """Сохраняет данные атомарно с созданием снапшота"""
-        # Обновляем tree из индекса
-        self._data["tree"] = [
-            self._node_to_dict(node) 
-            for node in self._get_root_nodes()
-        ]
-        
+        if not self._dirty:
+            return
+
+        # tree собирается итеративным to_dict с кэшем по поколению дерева —
+        # default-хук сериализатора здесь не подходит: orjson ограничивает
+        # глубину рекурсивных вызовов хука (~254), а деревья бывают глубже.
+        # _dumps уже возвращает UTF-8 байты — пишем в бинарном режиме
+        payload = {**self._data,
+                   "tree": [n.to_dict() for n in self._get_root_nodes()]}
         with self._atomic_save() as temp_path:
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(self._data, f, indent=2, ensure_ascii=False)
-        
-        # Перестраиваем индекс для гарантии консистентности
-        self._rebuild_index()
-        
-        # Создаём снапшот
+            with open(temp_path, 'wb') as f:
+                f.write(_dumps(payload))
+                if not _SKIP_FSYNC:
+                    f.flush()
+                    os.fsync(f.fileno())
+        # Флаг снимается только после успешной записи — упавший дамп
+        # оставляет данные грязными, и страховочный flush при выходе
+        # попробует ещё раз
+        self._dirty = False
+
+        # Граф Node в памяти авторитетен — перестраивать индекс из только
+        # что сериализованных данных не нужно
+
+        # Создаём снапшот: ручные — всегда, автоматические — с троттлингом,
+        # иначе сессия из сотни правок копирует базу сто раз подряд
         config = self._get_config()
         if config.auto_backup:
-            self._create_snapshot(manual_name)
+            if manual_name:
+                self._create_snapshot(manual_name)
+            else:
+                self._ops_since_snap += 1
+                now = time.monotonic()
+                if (now - self._last_snap_time > config.snap_interval_s
+                        or self._ops_since_snap >= config.snap_every_n):
+                    self._create_snapshot(None)
+                    self._last_snap_time = now
+                    self._ops_since_snap = 0
     
     def _create_snapshot(self, manual_name: Optional[str] = None) -> str:
         """Создаёт снапшот базы данных"""
         self.snap_dir.mkdir(exist_ok=True)
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        snap_name = manual_name or f"auto_{timestamp}.json"
-        snap_path = self.snap_dir / snap_name
-        
-        shutil.copy(self.db_path, snap_path)
+        if manual_name:
+            # Ручные снапшоты остаются обычным JSON — их читают люди.
+            # Жёсткая ссылка вместо копии байт: база после снапшота не
+            # мутируется на месте (_flush пишет новый файл через rename)
+            snap_name = manual_name
+            dest = self.snap_dir / snap_name
+            dest.unlink(missing_ok=True)
+            try:
+                os.link(self.db_path, dest)
+            except OSError:
+                # Другая файловая система (EXDEV) и т.п. — обычная копия
+                shutil.copy(self.db_path, dest)
+        else:
+            # Автоматические снапшоты сжимаем: структурированный JSON
+            # ужимается в разы, а таких снапшотов хранятся сотни
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            snap_name = f"auto_{timestamp}.json.gz"
+            with open(self.db_path, 'rb') as src:
+                with gzip.open(self.snap_dir / snap_name, 'wb', compresslevel=3) as dst:
+                    shutil.copyfileobj(src, dst)
         
         # Очистка старых снапшотов
         self._cleanup_snapshots()
@@ -400,25 +864,37 @@ class HBTDriver:
     def _cleanup_snapshots(self) -> None:
         """Удаляет старые автоматические снапшоты"""
         config = self._get_config()
-        auto_snaps = sorted([
-            f for f in self.snap_dir.iterdir() 
-            if f.name.startswith("auto_")
-        ], key=lambda x: x.stat().st_mtime, reverse=True)
-        
-        for snap in auto_snaps[config.max_snapshots:]:
-            snap.unlink()
+        # scandir отдаёт stat из кэша записи каталога — один системный проход
+        # вместо отдельного stat() на файл; полная сортировка не нужна,
+        # достаточно выбрать самых старых кандидатов на удаление
+        with os.scandir(self.snap_dir) as it:
+            auto_snaps = [
+                (entry.stat().st_mtime, entry.path)
+                for entry in it
+                if entry.name.startswith("auto_")
+            ]
+
+        excess = len(auto_snaps) - config.max_snapshots
+        if excess <= 0:
+            return
+        for _, path in heapq.nsmallest(excess, auto_snaps):
+            os.unlink(path)
     
     def _node_to_dict(self, node: Node) -> Dict[str, Any]:
         """Конвертирует Node в словарь для сохранения"""
         return node.to_dict()
     
     def _get_root_nodes(self) -> List[Node]:
-        """Возвращает корневые узлы"""
-        return [n for n in self._index.values() if n.parent_id is None]
+        """Возвращает корневые узлы без линейного прохода по индексу"""
+        return list(self._roots.values())
     
     def _get_config(self) -> ProjectConfig:
-        """Возвращает конфигурацию проекта"""
-        return ProjectConfig.from_dict(self._data.get("config", {}))
+        """Возвращает конфигурацию проекта (кэшируется после загрузки)"""
+        # Конфигурация после _load не меняется — пересобирать dataclass
+        # из словаря на каждом сохранении незачем
+        if self._config_cache is None:
+            self._config_cache = ProjectConfig.from_dict(self._data.get("config", {}))
+        return self._config_cache
     
     # ========================================================================
     # ЛОГИРОВАНИЕ
@@ -426,13 +902,53 @@ class HBTDriver:
     
     def _log(self, action: ActionType, node_id: str, text: str = "") -> None:
         """Добавляет запись в историю"""
-        entry = HistoryEntry(
-            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            action=action.value,
-            node_id=node_id,
-            text=text
-        )
-        self._data.setdefault("history", []).append(asdict(entry))
+        # Словарь собирается литералом: HistoryEntry + asdict на горячем
+        # пути логирования аллоцируют дважды ради того же результата
+        ts = _log_timestamp()
+        checksum = _history_checksum(self._last_checksum, action.value, node_id, text)
+        self._append_history({
+            "timestamp": ts,
+            "action": action.value,
+            "node_id": node_id,
+            "text": text,
+            "checksum": checksum,
+        })
+        # Хвост цепочки хранится в основном файле — _flush запишет его вместе
+        # с деревом, и после перезапуска цепочка продолжается без разрыва
+        self._last_checksum = checksum
+        self._data["last_checksum"] = checksum
+
+    def _append_history(self, entry_dict: Dict[str, Any]) -> None:
+        """Дописывает запись в NDJSON-файл истории — O(1) от размера истории"""
+        # Дескриптор открывается один раз и переживает все записи процесса;
+        # flush после каждой строки — чтобы get_history видел свежие данные
+        if self._hist_fp is None:
+            self._hist_fp = open(self.hist_path, 'ab')
+        self._hist_fp.write(_dumps_line(entry_dict) + b'\n')
+        self._hist_fp.flush()
+
+    def get_history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Возвращает записи истории (последние limit, если указан)"""
+        try:
+            f = open(self.hist_path, 'rb')
+        except FileNotFoundError:
+            return []
+        with f:
+            if limit is None or limit <= 0:
+                lines = f.read().splitlines()
+            else:
+                # Читаем только хвост: блоками с конца файла, пока не
+                # наберётся limit строк — история может быть огромной
+                f.seek(0, os.SEEK_END)
+                pos = f.tell()
+                buf = b''
+                while pos > 0 and buf.count(b'\n') <= limit:
+                    step = min(65536, pos)
+                    pos -= step
+                    f.seek(pos)
+                    buf = f.read(step) + buf
+                lines = buf.splitlines()[-limit:]
+        return [_loads(line) for line in lines if line]
     
     # ========================================================================
     # ПОИСК УЗЛОВ
@@ -440,27 +956,50 @@ class HBTDriver:
     
     def _generate_id(self) -> str:
         """Генерирует уникальный ID"""
-        return uuid.uuid4().hex[:12]
+        # PRNG сеется из os.urandom один раз на процесс — массовое создание
+        # узлов не делает syscall на каждый ID, формат остаётся 12 hex-символов
+        new_id = f"{_ID_RNG.getrandbits(48):012x}"
+        while new_id in self._index:
+            # 48 бит оставляют ненулевой шанс коллизии — молчаливая
+            # перезапись индекса недопустима, перегенерируем
+            new_id = f"{_ID_RNG.getrandbits(48):012x}"
+        return new_id
     
     def _resolve_id(self, identifier: str) -> str:
         """Разрешает ID или alias в реальный ID"""
+        return self._find_node(identifier).id
+
+    def _find_node(self, identifier: str) -> Node:
+        """Находит узел по ID или alias — один hash-пробинг в _lookup"""
         # Убираем @ в начале если есть (пользователь может ввести @alias)
         if identifier.startswith("@"):
             identifier = identifier[1:]
-        
-        # Сначала проверяем прямое совпадение по ID
-        if identifier in self._index:
-            return identifier
-        # Затем проверяем alias
-        if identifier in self._alias_index:
-            return self._alias_index[identifier]
+
+        node = self._lookup.get(identifier)
+        if node is not None:
+            return node
+        # Редкий случай: alias вытеснен из _lookup совпавшим с ним id
+        real_id = self._alias_index.get(identifier)
+        if real_id is not None:
+            return self._index[real_id]
         raise NodeNotFoundError(identifier)
     
-    def _find_node(self, identifier: str) -> Node:
-        """Находит узел по ID или alias"""
-        real_id = self._resolve_id(identifier)
-        return self._index[real_id]
-    
+    def _stats_add_node(self, node: Node) -> None:
+        """Учитывает узел в живых счётчиках статистики"""
+        if node.visible:
+            self._visible_count += 1
+        if node.status == _STATUS_LOCKED:
+            self._locked_count += 1
+        self._progress_counts[node.progress] += 1
+
+    def _stats_remove_node(self, node: Node) -> None:
+        """Снимает узел с учёта в живых счётчиках статистики"""
+        if node.visible:
+            self._visible_count -= 1
+        if node.status == _STATUS_LOCKED:
+            self._locked_count -= 1
+        self._progress_counts[node.progress] -= 1
+
     def _find_node_safe(self, identifier: str) -> Optional[Node]:
         """Безопасный поиск узла (возвращает None если не найден)"""
         try:
@@ -483,80 +1022,102 @@ class HBTDriver:
         filter_tags: Optional[List[str]] = None,
         filter_progress: Optional[List[str]] = None
     ) -> List[str]:
-        """Генерирует текстовое представление дерева"""
-        
+        """Генерирует текстовое представление дерева (список строк)"""
+        return list(self.iter_text_tree(
+            nodes=nodes,
+            max_depth=max_depth,
+            current_depth=current_depth,
+            prefix=prefix,
+            use_colors=use_colors,
+            show_hidden=show_hidden,
+            filter_tags=filter_tags,
+            filter_progress=filter_progress,
+        ))
+
+    def iter_text_tree(
+        self,
+        nodes: Optional[List[Node]] = None,
+        max_depth: Optional[int] = None,
+        current_depth: int = 0,
+        prefix: str = "",
+        use_colors: bool = True,
+        show_hidden: bool = False,
+        filter_tags: Optional[List[str]] = None,
+        filter_progress: Optional[List[str]] = None
+    ):
+        """Построчный генератор текстового дерева (итеративный DFS)
+
+        Потребители вроде export_tree пишут строки потоково, не собирая
+        всё дерево в память.
+        """
         if nodes is None:
             nodes = self._get_root_nodes()
-        
-        if max_depth is not None and current_depth > max_depth:
-            return []
-        
-        # Фильтрация
-        visible_nodes = []
-        for node in nodes:
-            if not node.visible and not show_hidden:
-                continue
-            if filter_tags and not any(t in node.tags for t in filter_tags):
-                continue
-            if filter_progress and node.progress not in filter_progress:
+
+        # Фильтры переводятся в frozenset один раз на вызов: проверка на
+        # узле — O(1)-пересечение вместо линейного прохода по списку
+        filter_tags = frozenset(filter_tags) if filter_tags else None
+        filter_progress = frozenset(filter_progress) if filter_progress else None
+
+        # ANSI-константы выбираются один раз на вызов
+        C_ID, C_LOCK, C_EDIT, C_TAG, C_ALIAS, C_DIM, C_END = (
+            _ANSI_ON if use_colors else _ANSI_OFF
+        )
+
+        def filter_level(level_nodes: List[Node]) -> List[Node]:
+            """Отфильтровывает узлы уровня по видимости/тегам/прогрессу"""
+            out = []
+            for node in level_nodes:
+                if not node.visible and not show_hidden:
+                    continue
+                if filter_tags and filter_tags.isdisjoint(node.tags):
+                    continue
+                if filter_progress and node.progress not in filter_progress:
+                    continue
+                out.append(node)
+            return out
+
+        # Явный стек вместо рекурсии: (узел, префикс, последний ли, глубина)
+        stack: List[tuple] = []
+        top = filter_level(nodes)
+        last_i = len(top) - 1
+        for i in range(last_i, -1, -1):
+            stack.append((top[i], prefix, i == last_i, current_depth))
+
+        while stack:
+            node, pfx, is_last, depth = stack.pop()
+            if max_depth is not None and depth > max_depth:
                 continue
-            visible_nodes.append(node)
-        
-        if not visible_nodes:
-            return []
-        
-        # ANSI Colors
-        C_ID = "\033[94m" if use_colors else ""      # Синий
-        C_LOCK = "\033[91m" if use_colors else ""    # Красный
-        C_EDIT = "\033[92m" if use_colors else ""    # Зелёный
-        C_TAG = "\033[93m" if use_colors else ""     # Жёлтый
-        C_ALIAS = "\033[95m" if use_colors else ""   # Пурпурный
-        C_DIM = "\033[90m" if use_colors else ""     # Серый
-        C_END = "\033[0m" if use_colors else ""
-        
-        lines = []
-        for i, node in enumerate(visible_nodes):
-            is_last = (i == len(visible_nodes) - 1)
             connector = "└── " if is_last else "├── "
-            
-            # Иконки статуса и прогресса
-            progress_enum = TaskProgress(node.progress) if node.progress in [e.value for e in TaskProgress] else TaskProgress.TODO
-            status_enum = NodeStatus(node.status) if node.status in [e.value for e in NodeStatus] else NodeStatus.EDITABLE
-            
-            p_icon = PROGRESS_ICONS.get(progress_enum, "⚪")
-            s_icon = STATUS_ICONS.get(status_enum, "✍️")
+
+            # Иконки статуса и прогресса — прямой словарный доступ по строке
+            p_icon = PROGRESS_ICONS_BY_STR.get(node.progress, "⚪")
+            s_icon = STATUS_ICONS_BY_STR.get(node.status, "✍️")
             color = C_LOCK if node.is_locked() else C_EDIT
-            
+
             # Формируем строку
             hidden_mark = f" {C_DIM}[HIDDEN]{C_END}" if not node.visible else ""
-            
+
             # ID и alias
             id_part = f"{C_ID}{node.id[:8]}{C_END}"
             alias_part = f" {C_ALIAS}@{node.alias}{C_END}" if node.alias else ""
-            
+
             # Теги
             tags_part = ""
             if node.tags:
                 tags_str = " ".join(f"#{t}" for t in node.tags)
                 tags_part = f" {C_TAG}{tags_str}{C_END}"
-            
-            line = f"{prefix}{connector}{id_part}{alias_part} {p_icon} {node.text}{tags_part}{hidden_mark} {color}{s_icon}{C_END}"
-            lines.append(line)
-            
-            # Рекурсия для детей
-            new_prefix = prefix + ("    " if is_last else "│   ")
-            lines.extend(self.get_text_tree(
-                nodes=node.children,
-                max_depth=max_depth,
-                current_depth=current_depth + 1,
-                prefix=new_prefix,
-                use_colors=use_colors,
-                show_hidden=show_hidden,
-                filter_tags=filter_tags,
-                filter_progress=filter_progress
-            ))
-        
-        return lines
+
+            yield (
+                f"{pfx}{connector}{id_part}{alias_part} {p_icon} {node.text}"
+                f"{tags_part}{hidden_mark} {color}{s_icon}{C_END}"
+            )
+
+            children = filter_level(node.children)
+            if children:
+                new_prefix = pfx + ("    " if is_last else "│   ")
+                last_i = len(children) - 1
+                for i in range(last_i, -1, -1):
+                    stack.append((children[i], new_prefix, i == last_i, depth + 1))
     
     # ========================================================================
     # CRUD ОПЕРАЦИИ
@@ -571,7 +1132,28 @@ class HBTDriver:
         alias: Optional[str] = None
     ) -> str:
         """Добавляет новый узел"""
-        
+        node = self._insert_node(parent_id, text, is_locked, tags, alias)
+
+        self._log(ActionType.ADD, node.id, node.text)
+        self._save()
+
+        status_mark = "L" if is_locked else "E"
+        alias_info = f" @{alias}" if alias else ""
+        return f"✅ Добавлено: {node.id[:8]}{alias_info} [{status_mark}]"
+
+    def _insert_node(
+        self,
+        parent_id: Optional[str],
+        text: str,
+        is_locked: bool = False,
+        tags: Optional[List[str]] = None,
+        alias: Optional[str] = None
+    ) -> Node:
+        """Создаёт узел и вносит его в структуры — без логирования и записи
+
+        Пакетные пути (import_tasks) вызывают это в цикле и сохраняют один
+        раз, вместо полного цикла журнал+дамп на каждую строку.
+        """
         # Валидация
         if not text or not text.strip():
             raise ValidationError("Текст узла не может быть пустым")
@@ -593,7 +1175,7 @@ class HBTDriver:
         node = Node(
             id=new_id,
             text=text.strip(),
-            status=NodeStatus.LOCKED.value if is_locked else NodeStatus.EDITABLE.value,
+            status=_STATUS_LOCKED if is_locked else _STATUS_EDITABLE,
             tags=tags or [],
             alias=alias,
             parent_id=parent.id if parent else None
@@ -602,20 +1184,41 @@ class HBTDriver:
         # Добавляем в структуру
         if parent:
             parent.children.append(node)
-        # Корневые узлы будут добавлены в tree при _save() через _get_root_nodes()
+        else:
+            # Корневые узлы попадут в tree при _save() через _get_root_nodes()
+            self._roots[new_id] = node
         
-        # Обновляем индекс
+        # Обновляем индексы
         self._index[new_id] = node
+        self._lookup[new_id] = node
         if alias:
             self._alias_index[alias] = new_id
-        
-        self._log(ActionType.ADD, new_id, text)
+            self._lookup.setdefault(alias, node)
+        self._text_lower[new_id] = node.text.lower()
+        for t in node.tags:
+            self._tag_index.setdefault(t, set()).add(new_id)
+        self._stats_add_node(node)
+
+        return node
+
+    def add_nodes_bulk(self, items: List[tuple]) -> str:
+        """Добавляет несколько узлов за одно сохранение.
+
+        items — список кортежей (parent_id, text) или (parent_id, text,
+        kwargs), где kwargs передаются в add_node (is_locked, tags, alias).
+        Журнал получает запись на каждый узел, дамп базы пишется один раз.
+        """
+        created = []
+        for item in items:
+            kwargs = item[2] if len(item) > 2 else {}
+            created.append(self._insert_node(item[0], item[1], **kwargs))
+
+        for node in created:
+            self._log(ActionType.ADD, node.id, node.text)
         self._save()
-        
-        status_mark = "L" if is_locked else "E"
-        alias_info = f" @{alias}" if alias else ""
-        return f"✅ Добавлено: {new_id[:8]}{alias_info} [{status_mark}]"
-    
+
+        return f"✅ Добавлено узлов: {len(created)}"
+
     def edit_node(self, node_id: str, new_text: str) -> str:
         """Редактирует текст узла"""
         node = self._find_node(node_id)
@@ -626,9 +1229,15 @@ class HBTDriver:
         if not new_text or not new_text.strip():
             raise ValidationError("Текст узла не может быть пустым")
         
+        new_text = new_text.strip()
+        if node.text == new_text:
+            # Текст не изменился — без записи в журнал и дампа базы
+            return f"✅ Текст узла {node.id[:8]} обновлен"
+
         old_text = node.text
-        node.text = new_text.strip()
-        node.updated_at = datetime.now().isoformat()
+        node.text = new_text
+        node.updated_at = _now_iso()
+        self._text_lower[node.id] = node.text.lower()
         
         self._log(ActionType.EDIT, node.id, f"{old_text} -> {new_text}")
         self._save()
@@ -649,9 +1258,11 @@ class HBTDriver:
                 f"delete (содержит заблокированные узлы: {', '.join(locked_ids[:3])}...)"
             )
         
+        if node.visible:
+            self._visible_count -= 1
         node.visible = False
-        node.updated_at = datetime.now().isoformat()
-        
+        node.updated_at = _now_iso()
+
         self._log(ActionType.DELETE, node.id, node.text)
         self._save()
         
@@ -662,39 +1273,59 @@ class HBTDriver:
         node = self._find_node(node_id)
         
         # Валидация статуса
-        try:
-            status_enum = NodeStatus(status)
-        except ValueError:
+        if status not in _STATUS_VALUES:
             raise ValidationError(f"Неверный статус: {status}. Допустимые: locked, editable")
-        
-        self._apply_status(node, status_enum.value, recursive)
+
+        # Нерекурсивная установка уже стоящего статуса — no-op
+        if not recursive and node.status == status:
+            return f"✅ Статус {node.id[:8]} -> {status} "
+
+        self._apply_status(node, sys.intern(status), recursive, _now_iso())
         
         self._log(ActionType.STATUS_CHANGE, node.id, f"{status} (recursive={recursive})")
         self._save()
         
         return f"✅ Статус {node.id[:8]} -> {status} {'(рекурсивно)' if recursive else ''}"
     
-    def _apply_status(self, node: Node, status: str, recursive: bool) -> None:
-        """Рекурсивно применяет статус"""
+    def _apply_status(self, node: Node, status: str, recursive: bool,
+                      ts: Optional[str] = None) -> None:
+        """Рекурсивно применяет статус
+
+        Метка времени вычисляется один раз и передаётся вниз — рекурсивный
+        проход не форматирует datetime на каждый узел.
+        """
+        if ts is None:
+            ts = _now_iso()
+        was_locked = node.status == _STATUS_LOCKED
         node.status = status
-        node.updated_at = datetime.now().isoformat()
-        
+        node.updated_at = ts
+        now_locked = status == _STATUS_LOCKED
+        if was_locked != now_locked:
+            self._locked_count += 1 if now_locked else -1
+
         if recursive:
             for child in node.children:
-                self._apply_status(child, status, True)
+                self._apply_status(child, status, True, ts)
     
     def set_progress(self, node_id: str, progress: str) -> str:
         """Изменяет прогресс задачи"""
         node = self._find_node(node_id)
         
-        try:
-            progress_enum = TaskProgress(progress)
-        except ValueError:
+        if progress not in _PROGRESS_VALUES:
             valid = ", ".join(e.value for e in TaskProgress)
             raise ValidationError(f"Неверный прогресс: {progress}. Допустимые: {valid}")
-        
-        node.progress = progress_enum.value
-        node.updated_at = datetime.now().isoformat()
+
+        if node.progress == progress:
+            # Прогресс не изменился — без записи в журнал и дампа базы
+            return f"✅ Прогресс {node.id[:8]} -> {progress}"
+
+        # Интернированное значение: сравнения и Counter-ключи работают
+        # по указателю, как и у узлов, прошедших через _from_fields
+        progress = sys.intern(progress)
+        self._progress_counts[node.progress] -= 1
+        self._progress_counts[progress] += 1
+        node.progress = progress
+        node.updated_at = _now_iso()
         
         self._log(ActionType.PROGRESS_CHANGE, node.id, progress)
         self._save()
@@ -716,12 +1347,21 @@ class HBTDriver:
                 f"rewrite (содержит заблокированные узлы: {', '.join(i[:8] for i in locked_ids[:3])})"
             )
         
-        # Удаляем старых детей из индекса
+        # Удаляем старых детей из индексов
         def remove_from_index(n: Node):
             if n.id in self._index:
                 del self._index[n.id]
+            self._lookup.pop(n.id, None)
             if n.alias and n.alias in self._alias_index:
                 del self._alias_index[n.alias]
+                if self._lookup.get(n.alias) is n:
+                    del self._lookup[n.alias]
+            self._text_lower.pop(n.id, None)
+            for t in n.tags:
+                ids = self._tag_index.get(t)
+                if ids:
+                    ids.discard(n.id)
+            self._stats_remove_node(n)
             for child in n.children:
                 remove_from_index(child)
         
@@ -741,15 +1381,32 @@ class HBTDriver:
             )
             new_children.append(child)
             self._index[child_id] = child
+            self._lookup[child_id] = child
+            self._text_lower[child_id] = child.text.lower()
+            self._stats_add_node(child)
         
         node.children = new_children
-        node.updated_at = datetime.now().isoformat()
+        node.updated_at = _now_iso()
+        self._ancestor_cache.clear()
         
         self._log(ActionType.REWRITE, node.id, f"Replaced with {len(new_children)} items")
         self._save()
         
         return f"✅ Подпункты {node.id[:8]} перезаписаны ({len(new_children)} шт.)"
     
+    def _is_descendant(self, ancestor: Node, target_id: str) -> bool:
+        """Проверяет, является ли target_id потомком ancestor
+
+        Итеративный обход с ранним выходом — без рекурсии и лимита глубины.
+        """
+        stack = list(ancestor.children)
+        while stack:
+            n = stack.pop()
+            if n.id == target_id:
+                return True
+            stack.extend(n.children)
+        return False
+
     def move_node(self, node_id: str, new_parent_id: str) -> str:
         """Перемещает узел к новому родителю"""
         node = self._find_node(node_id)
@@ -764,36 +1421,31 @@ class HBTDriver:
                 old_parent = self._find_node(node.parent_id)
                 old_parent.children = [c for c in old_parent.children if c.id != node.id]
             node.parent_id = None
+            self._roots[node.id] = node
         elif new_parent is None:
             # Узел не найден и это не спец-значение "root"
             raise NodeNotFoundError(new_parent_id)
         else:
             # Обычное перемещение под new_parent
-            
-            # Проверяем, что не перемещаем в собственного потомка
-            def is_descendant_of(ancestor: Node, target_id: str) -> bool:
-                """Проверяет, является ли target_id потомком ancestor"""
-                for child in ancestor.children:
-                    if child.id == target_id:
-                        return True
-                    if is_descendant_of(child, target_id):
-                        return True
-                return False
-            
+
             # Проверяем что new_parent не является потомком node
-            if is_descendant_of(node, new_parent.id):
+            if self._is_descendant(node, new_parent.id):
                 raise ValidationError("Нельзя переместить узел в собственного потомка")
             
-            # Находим и удаляем из старого родителя
+            # Находим и удаляем из старого родителя (или из корней)
             if node.parent_id:
                 old_parent = self._find_node(node.parent_id)
                 old_parent.children = [c for c in old_parent.children if c.id != node.id]
-            
+            else:
+                self._roots.pop(node.id, None)
+
             new_parent.children.append(node)
             node.parent_id = new_parent.id
         
-        node.updated_at = datetime.now().isoformat()
-        
+        node.updated_at = _now_iso()
+        # Перемещение меняет цепочки предков всего поддерева — сброс целиком
+        self._ancestor_cache.clear()
+
         self._log(ActionType.MOVE, node.id, f"Moved to {new_parent_id}")
         self._save()
         
@@ -813,7 +1465,8 @@ class HBTDriver:
         
         if tag not in node.tags:
             node.tags.append(tag)
-            node.updated_at = datetime.now().isoformat()
+            node.updated_at = _now_iso()
+            self._tag_index.setdefault(tag, set()).add(node.id)
             self._log(ActionType.TAG_ADD, node.id, tag)
             self._save()
         
@@ -826,7 +1479,10 @@ class HBTDriver:
         tag = tag.strip().lower()
         if tag in node.tags:
             node.tags.remove(tag)
-            node.updated_at = datetime.now().isoformat()
+            node.updated_at = _now_iso()
+            ids = self._tag_index.get(tag)
+            if ids:
+                ids.discard(node.id)
             self._log(ActionType.TAG_REMOVE, node.id, tag)
             self._save()
         
@@ -836,10 +1492,12 @@ class HBTDriver:
         """Устанавливает или удаляет alias узла"""
         node = self._find_node(node_id)
         
-        # Удаляем старый alias из индекса
+        # Удаляем старый alias из индексов
         if node.alias and node.alias in self._alias_index:
             del self._alias_index[node.alias]
-        
+            if self._lookup.get(node.alias) is node:
+                del self._lookup[node.alias]
+
         if alias:
             alias = alias.strip().lstrip("@")  # Убираем @ если пользователь добавил
             
@@ -852,9 +1510,10 @@ class HBTDriver:
                 raise ValidationError(f"Alias '{alias}' уже используется")
             
             self._alias_index[alias] = node.id
-        
+            self._lookup.setdefault(alias, node)
+
         node.alias = alias
-        node.updated_at = datetime.now().isoformat()
+        node.updated_at = _now_iso()
         
         self._log(ActionType.ALIAS_SET, node.id, alias or "(removed)")
         self._save()
@@ -871,82 +1530,80 @@ class HBTDriver:
         self,
         query: str,
         include_hidden: bool = False,
-        tags: Optional[List[str]] = None
+        tags: Optional[List[str]] = None,
+        limit: Optional[int] = None
     ) -> List[Dict[str, str]]:
-        """Поиск узлов по тексту и тегам"""
+        """Поиск узлов по тексту и тегам
+
+        limit ограничивает число результатов — сканирование прерывается,
+        как только они набраны.
+        """
         results = []
         query_lower = query.lower()
-        
+
+        # Кандидаты по тегам — объединение множеств инвертированного индекса:
+        # проверка на узел становится O(1) вместо перебора списка тегов
+        tag_ids: Optional[set] = None
+        if tags:
+            tag_ids = set()
+            for t in tags:
+                tag_ids |= self._tag_index.get(t, set())
+
+        text_lower = self._text_lower
         for node in self._index.values():
             if not node.visible and not include_hidden:
                 continue
-            
-            # Поиск по тексту (если query не пустой)
-            text_match = query_lower and query_lower in node.text.lower()
-            
+
+            # Поиск по тексту (если query не пустой) — по кэшу нижнего регистра
+            text_match = query_lower and query_lower in text_lower.get(node.id, node.text.lower())
+
             # Поиск по alias (если query не пустой)
             alias_match = query_lower and node.alias and query_lower in node.alias.lower()
-            
+
             # Поиск по тегам (если указаны теги)
-            tag_match = tags and any(t in node.tags for t in tags)
-            
+            tag_match = tag_ids is not None and node.id in tag_ids
+
             # Если указан query — ищем по тексту/alias
             # Если указаны tags — фильтруем по тегам
             # Если указано и то и другое — нужно совпадение обоих условий
             if query_lower and tags:
-                # Оба условия: текст/alias И теги
-                if (text_match or alias_match) and tag_match:
-                    results.append({
-                        "id": node.id,
-                        "alias": node.alias,
-                        "text": node.text,
-                        "status": node.status,
-                        "progress": node.progress,
-                        "tags": node.tags
-                    })
+                matched = (text_match or alias_match) and tag_match
             elif query_lower:
-                # Только текст/alias
-                if text_match or alias_match:
-                    results.append({
-                        "id": node.id,
-                        "alias": node.alias,
-                        "text": node.text,
-                        "status": node.status,
-                        "progress": node.progress,
-                        "tags": node.tags
-                    })
-            elif tags:
-                # Только теги
-                if tag_match:
-                    results.append({
-                        "id": node.id,
-                        "alias": node.alias,
-                        "text": node.text,
-                        "status": node.status,
-                        "progress": node.progress,
-                        "tags": node.tags
-                    })
-        
+                matched = text_match or alias_match
+            else:
+                matched = bool(tags) and tag_match
+
+            if matched:
+                results.append({
+                    "id": node.id,
+                    "alias": node.alias,
+                    "text": node.text,
+                    "status": node.status,
+                    "progress": node.progress,
+                    "tags": node.tags
+                })
+                if limit is not None and len(results) >= limit:
+                    break
+
         return results
     
     def get_path(self, node_id: str) -> str:
         """Возвращает путь до узла"""
         node = self._find_node(node_id)
-        
-        path = []
-        current: Optional[Node] = node
-        while current is not None:
-            display_id = current.alias or current.id[:8]
-            path.append(f"{display_id}: {current.text}")
-            if current.parent_id:
-                try:
-                    current = self._find_node(current.parent_id)
-                except NodeNotFoundError:
-                    current = None
-            else:
-                current = None
-        
-        path.reverse()
+
+        # Цепочка предков кэшируется по id (инвалидация при перемещениях);
+        # текст и alias читаются с живых узлов, поэтому правки их не ломают
+        chain = self._ancestor_cache.get(node.id)
+        if chain is None:
+            chain = []
+            current: Optional[Node] = node
+            while current is not None:
+                chain.append(current)
+                # parent_id — всегда настоящий id, alias-разрешение не нужно
+                current = self._lookup.get(current.parent_id) if current.parent_id else None
+            self._ancestor_cache[node.id] = chain
+
+        path = [f"{c.alias or c.id[:8]}: {c.text}" for c in reversed(chain)]
         return " → ".join(path)
     
     def get_next(self) -> str:
@@ -955,7 +1612,7 @@ class HBTDriver:
             for node in nodes:
                 if not node.visible:
                     continue
-                if node.progress == TaskProgress.DONE.value:
+                if node.progress == _PROGRESS_DONE:
                     continue
                 
                 # Проверяем детей
@@ -965,7 +1622,7 @@ class HBTDriver:
                     return node
                 
                 # Все дети выполнены?
-                if all(c.progress == TaskProgress.DONE.value for c in visible_children):
+                if all(c.progress == _PROGRESS_DONE for c in visible_children):
                     return node
                 
                 # Ищем в детях
@@ -989,42 +1646,36 @@ class HBTDriver:
     
     def get_stats(self) -> Dict[str, Any]:
         """Возвращает статистику проекта"""
-        stats = {
-            "total": 0,
-            "visible": 0,
-            "hidden": 0,
-            "locked": 0,
-            "editable": 0,
-            "by_progress": {p.value: 0 for p in TaskProgress},
-            "tags": {},
+        # Счётчики поддерживаются инкрементально мутирующими операциями,
+        # а частоты тегов выводятся из инвертированного индекса — полного
+        # сканирования дерева здесь больше нет
+        total = len(self._index)
+        visible = self._visible_count
+        locked = self._locked_count
+
+        return {
+            "total": total,
+            "visible": visible,
+            "hidden": total - visible,
+            "locked": locked,
+            "editable": total - locked,
+            "by_progress": {p.value: self._progress_counts.get(p.value, 0)
+                            for p in TaskProgress},
+            "tags": {t: len(ids) for t, ids in self._tag_index.items() if ids},
         }
-        
-        for node in self._index.values():
-            stats["total"] += 1
-            
-            if node.visible:
-                stats["visible"] += 1
-            else:
-                stats["hidden"] += 1
-            
-            if node.is_locked():
-                stats["locked"] += 1
-            else:
-                stats["editable"] += 1
-            
-            if node.progress in stats["by_progress"]:
-                stats["by_progress"][node.progress] += 1
-            
-            for tag in node.tags:
-                stats["tags"][tag] = stats["tags"].get(tag, 0) + 1
-        
-        return stats
     
     def get_snapshots(self) -> List[str]:
         """Возвращает список доступных снапшотов"""
-        if not self.snap_dir.exists():
+        # scandir без Path-обёрток на запись; отсутствие каталога дешевле
+        # поймать, чем проверять отдельным stat'ом
+        try:
+            with os.scandir(self.snap_dir) as it:
+                return sorted(
+                    e.name for e in it
+                    if e.name.endswith(('.json', '.json.gz'))
+                )
+        except FileNotFoundError:
             return []
-        return sorted(f.name for f in self.snap_dir.iterdir() if f.suffix == '.json')
     
     def restore_snapshot(self, filename: str) -> str:
         """Восстанавливает базу из снапшота"""
@@ -1036,7 +1687,25 @@ class HBTDriver:
         # Создаём backup текущего состояния
         self._create_snapshot(f"pre_restore_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
         
-        shutil.copy(snap_path, self.db_path)
+        if snap_path.suffix == '.gz':
+            # Распаковываем во временный файл и подменяем через rename:
+            # запись напрямую в db_path обнулила бы inode, который делит
+            # с базой только что созданный hardlink-бэкап pre_restore_*
+            tmp = self.db_path.with_suffix('.tmp')
+            with gzip.open(snap_path, 'rb') as src:
+                with open(tmp, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            os.replace(tmp, self.db_path)
+        else:
+            # Снапшоты иммутабельны — достаточно метаданных: hardlink во
+            # временное имя + атомарный rename, без перечитывания байтов
+            tmp = self.db_path.with_suffix('.tmp')
+            tmp.unlink(missing_ok=True)
+            try:
+                os.link(snap_path, tmp)
+            except OSError:
+                shutil.copy(snap_path, tmp)
+            os.replace(tmp, self.db_path)
         self._load()
         
         self._log(ActionType.RESTORE, "system", filename)
@@ -1052,8 +1721,20 @@ class HBTDriver:
         self._create_snapshot(f"pre_clear_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
         
         self._data = self._get_default_data()
+        self._config_cache = None
+        # Файл истории не очищается — хвост цепочки сумм переносим в новые данные
+        if self._last_checksum:
+            self._data["last_checksum"] = self._last_checksum
         self._index.clear()
         self._alias_index.clear()
+        self._lookup.clear()
+        self._roots.clear()
+        self._text_lower.clear()
+        self._tag_index.clear()
+        self._ancestor_cache.clear()
+        self._visible_count = 0
+        self._locked_count = 0
+        self._progress_counts.clear()
         self._save()
         
         return "✅ База данных очищена. Снимок сохранен в .hbt_history"
@@ -1074,20 +1755,27 @@ class HBTDriver:
         except Exception as e:
             raise HBTError(f"Ошибка чтения файла: {e}")
         
+        # Пакетная вставка: одна запись истории и один дамп на весь файл
         count = 0
         for line in lines:
-            self.add_node(parent_id, line)
+            self._insert_node(parent_id, line)
             count += 1
-        
+
+        self._log(ActionType.IMPORT, "system", f"{count} nodes from {path.name}")
+        self._save()
+
         return f"✅ Импортировано {count} узлов"
     
     def export_tree(self, filepath: str, use_colors: bool = False) -> str:
         """Экспортирует дерево в текстовый файл"""
-        lines = self.get_text_tree(use_colors=use_colors)
-        
+        # Строки пишутся потоково из генератора — без склейки всего дерева
+        # в одну гигантскую строку; крупный буфер снижает число syscall'ов
         path = Path(filepath)
-        path.write_text("\n".join(lines), encoding='utf-8')
-        
+        with open(path, 'wb', buffering=1 << 20) as f:
+            for line in self.iter_text_tree(use_colors=use_colors):
+                f.write(line.encode('utf-8'))
+                f.write(b'\n')
+
         return f"📄 Экспортировано в {filepath}"
     
     # ========================================================================
@@ -1111,21 +1799,34 @@ class HBTDriver:
                     issues.append(f"Дублирующийся alias '{node.alias}' у узлов {seen_aliases[node.alias][:8]} и {node.id[:8]}")
                 seen_aliases[node.alias] = node.id
         
-        # Проверяем циклические ссылки
-        def has_cycle(node_id: str, visited: set) -> bool:
-            if node_id in visited:
-                return True
-            node = self._index.get(node_id)
-            if not node or not node.parent_id:
-                return False
-            visited.add(node_id)
-            return has_cycle(node.parent_id, visited)
-        
-        for node_id in self._index:
-            if has_cycle(node_id, set()):
-                issues.append(f"Обнаружена циклическая ссылка для узла {node_id[:8]}")
+        # Проверяем циклические ссылки: один проход с трёхцветной раскраской.
+        # 1 — узел на текущем пути, 2 — доказанно ацикличен; цепочка до уже
+        # проверенного предка не обходится повторно, суммарно O(N)
+        color: Dict[str, int] = {}
+        index_get = self._index.get
+        for start_id in self._index:
+            if color.get(start_id):
+                continue
+            path = []
+            cur = start_id
+            cycle = False
+            while cur is not None:
+                state = color.get(cur)
+                if state == 2:
+                    break
+                if state == 1:
+                    cycle = True
+                    break
+                color[cur] = 1
+                path.append(cur)
+                node = index_get(cur)
+                cur = node.parent_id if node else None
+            if cycle:
+                issues.append(f"Обнаружена циклическая ссылка для узла {start_id[:8]}")
                 break
-        
+            for nid in path:
+                color[nid] = 2
+
         return issues
     
     # ========================================================================
@@ -1135,6 +1836,9 @@ class HBTDriver:
     @property
     def data(self) -> Dict[str, Any]:
         """Обратная совместимость со старым API"""
+        # tree больше не пересобирается при каждом сохранении — обновляем
+        # словарное представление лениво, только когда к нему обращаются
+        self._data["tree"] = [node.to_dict() for node in self._get_root_nodes()]
         return self._data
 
 
@@ -1142,8 +1846,19 @@ class HBTDriver:
 # CLI ИНТЕРФЕЙС
 # ============================================================================
 
+_PARSER: Optional[argparse.ArgumentParser] = None
+
+
 def create_parser() -> argparse.ArgumentParser:
-    """Создаёт парсер аргументов командной строки"""
+    """Возвращает парсер аргументов (строится один раз на процесс)"""
+    global _PARSER
+    if _PARSER is None:
+        _PARSER = _build_parser()
+    return _PARSER
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    """Собирает дерево argparse-субпарсеров"""
     parser = argparse.ArgumentParser(
         prog="hbt",
         description="HBT (Hierarchical Block Text) — CLI для управления иерархическими задачами",
@@ -1225,6 +1940,7 @@ def create_parser() -> argparse.ArgumentParser:
     s.add_argument("query", help="Поисковый запрос")
     s.add_argument("--tags", nargs="+", help="Фильтр по тегам")
     s.add_argument("--all", action="store_true", help="Искать в скрытых")
+    s.add_argument("--limit", type=int, default=100, help="Максимум результатов")
     
     # ========== PATH ==========
     pt = subparsers.add_parser("path", help="Показать путь до узла")
@@ -1267,43 +1983,43 @@ def create_parser() -> argparse.ArgumentParser:
     return parser
 
 
+# Диспетчеризация форматирования ошибок по типу: один dict-поиск по __mro__
+# вместо цепочки isinstance-проверок
+_ERROR_FORMATTERS = {
+    NodeNotFoundError: lambda e: f"❌ Узел '{e.node_id}' не найден",
+    NodeLockedError: lambda e: (
+        f"🔒 Узел '{e.node_id}' заблокирован. Операция '{e.operation}' запрещена"
+    ),
+    ValidationError: lambda e: f"⚠️ Ошибка валидации: {e}",
+    HBTError: lambda e: f"❌ {e}",
+}
+
+
 def format_error(error: Exception) -> str:
     """Форматирует ошибку для вывода"""
-    if isinstance(error, NodeNotFoundError):
-        return f"❌ Узел '{error.node_id}' не найден"
-    elif isinstance(error, NodeLockedError):
-        return f"🔒 Узел '{error.node_id}' заблокирован. Операция '{error.operation}' запрещена"
-    elif isinstance(error, ValidationError):
-        return f"⚠️ Ошибка валидации: {error}"
-    elif isinstance(error, HBTError):
-        return f"❌ {error}"
-    else:
-        return f"💥 Неожиданная ошибка: {error}"
+    for cls in type(error).__mro__:
+        fmt = _ERROR_FORMATTERS.get(cls)
+        if fmt is not None:
+            return fmt(error)
+    return f"💥 Неожиданная ошибка: {error}"
 
 
 def main():
     """Точка входа CLI"""
     parser = create_parser()
     args = parser.parse_args()
-    
+
     if not args.command:
         parser.print_help()
         return 0
-    
-    try:
-        driver = HBTDriver()
-    except IntegrityError as e:
-        print(format_error(e), file=sys.stderr)
-        return 1
-    
+
+    # Один try на инициализацию и выполнение: format_error сам различает
+    # типы ошибок, отдельная ветка под IntegrityError не нужна
     try:
-        result = execute_command(driver, args)
+        result = execute_command(HBTDriver(), args)
         if result:
             print(result)
         return 0
-    except HBTError as e:
-        print(format_error(e), file=sys.stderr)
-        return 1
     except KeyboardInterrupt:
         print("\n⚡ Прервано пользователем")
         return 130
@@ -1312,161 +2028,213 @@ def main():
         return 1
 
 
+def _cmd_view(driver: HBTDriver, args: argparse.Namespace) -> str:
+    nodes = None
+    if args.id:
+        target = driver._find_node(args.id)
+        nodes = [target]
+
+    tree = driver.get_text_tree(
+        nodes=nodes,
+        max_depth=args.depth,
+        use_colors=not args.raw,
+        show_hidden=args.all,
+        filter_tags=args.tags,
+        filter_progress=args.progress
+    )
+    return "\n".join(tree) if tree else "📭 Дерево пусто"
+
+
+def _cmd_add(driver: HBTDriver, args: argparse.Namespace) -> str:
+    parent = args.to if args.to != "root" else None
+    return driver.add_node(
+        parent_id=parent,
+        text=args.text,
+        is_locked=args.locked,
+        tags=args.tags,
+        alias=args.alias
+    )
+
+
+def _cmd_edit(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.edit_node(args.id, args.text)
+
+
+def _cmd_delete(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.delete_node(args.id, force=args.force)
+
+
+def _cmd_move(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.move_node(args.id, args.to)
+
+
+def _cmd_status(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.set_status(args.id, args.mode, args.recursive)
+
+
+def _cmd_set_progress(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.set_progress(args.id, args.state)
+
+
+def _cmd_rewrite(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.rewrite_children(args.id, args.items, force=args.force)
+
+
+def _cmd_tag(driver: HBTDriver, args: argparse.Namespace) -> str:
+    results = []
+    if args.add:
+        for tag in args.add:
+            results.append(driver.add_tag(args.id, tag))
+    if args.remove:
+        for tag in args.remove:
+            results.append(driver.remove_tag(args.id, tag))
+    return "\n".join(results) if results else "⚠️ Укажите --add или --remove"
+
+
+def _cmd_alias(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.set_alias(args.id, args.name)
+
+
+def _cmd_search(driver: HBTDriver, args: argparse.Namespace) -> str:
+    results = driver.search(args.query, include_hidden=args.all, tags=args.tags,
+                            limit=args.limit)
+    if not results:
+        return "🔍 Ничего не найдено"
+
+    lines = []
+    for r in results:
+        alias_part = f" @{r['alias']}" if r['alias'] else ""
+        tags_part = f" #{' #'.join(r['tags'])}" if r['tags'] else ""
+        lines.append(f"{r['id'][:8]}{alias_part} — {r['text']}{tags_part}")
+    return "\n".join(lines)
+
+
+def _cmd_path(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.get_path(args.id)
+
+
+def _cmd_next(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.get_next()
+
+
+def _cmd_history(driver: HBTDriver, args: argparse.Namespace) -> str:
+    history = driver.get_history(args.limit)
+    if not history:
+        return "📜 История пуста"
+
+    lines = []
+    for entry in history:
+        checksum = entry.get('checksum', '')[:6]
+        node_id = entry.get('node_id', entry.get('id', 'unknown'))  # Совместимость со старым форматом
+        lines.append(f"[{entry['timestamp']}] {checksum} {entry['action'].upper()} {node_id[:8]} — {entry['text']}")
+    return "\n".join(lines)
+
+
+def _cmd_stats(driver: HBTDriver, args: argparse.Namespace) -> str:
+    s = driver.get_stats()
+
+    lines = [
+        "📊 Статистика проекта:",
+        f"  Всего узлов: {s['total']}",
+        f"  ├── Видимых: {s['visible']}",
+        f"  └── Скрытых: {s['hidden']}",
+        f"  Заблокировано 🔒: {s['locked']}",
+        f"  Редактируемых ✍️: {s['editable']}",
+        "",
+        "  Прогресс:",
+    ]
+
+    for progress, count in s['by_progress'].items():
+        icon = PROGRESS_ICONS_BY_STR.get(progress, "⚪")
+        lines.append(f"    {icon} {progress}: {count}")
+
+    if s['tags']:
+        lines.append("")
+        lines.append("  Топ тегов:")
+        # Топ-5 без полной сортировки: O(T log 5) вместо O(T log T)
+        for tag, count in heapq.nlargest(5, s['tags'].items(), key=itemgetter(1)):
+            lines.append(f"    #{tag}: {count}")
+
+    return "\n".join(lines)
+
+
+def _cmd_import(driver: HBTDriver, args: argparse.Namespace) -> str:
+    parent = args.to if args.to != "root" else None
+    return driver.import_tasks(parent, args.file)
+
+
+def _cmd_export(driver: HBTDriver, args: argparse.Namespace) -> str:
+    return driver.export_tree(args.file, use_colors=False)
+
+
+def _cmd_backup(driver: HBTDriver, args: argparse.Namespace) -> str:
+    name = f"manual_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    driver._create_snapshot(name)
+    return f"💾 Создан ручной снимок: {name}"
+
+
+def _cmd_rollback(driver: HBTDriver, args: argparse.Namespace) -> str:
+    if args.restore:
+        return driver.restore_snapshot(args.restore)
+
+    snaps = driver.get_snapshots()
+    if not snaps:
+        return "📜 Нет доступных снапшотов"
+
+    lines = ["📜 Доступные точки восстановления:"]
+    for snap in snaps[-20:]:  # Последние 20
+        lines.append(f"  - {snap}")
+    return "\n".join(lines)
+
+
+def _cmd_clear(driver: HBTDriver, args: argparse.Namespace) -> str:
+    if not args.yes:
+        confirm = input("⚠️ Вы уверены, что хотите очистить ВСЕ данные? (y/n): ")
+        if confirm.lower() != 'y':
+            return "❌ Отменено"
+    return driver.clear_all(confirm=True)
+
+
+def _cmd_verify(driver: HBTDriver, args: argparse.Namespace) -> str:
+    issues = driver.verify_integrity()
+    if not issues:
+        return "✅ Целостность данных в порядке"
+    return "⚠️ Обнаружены проблемы:\n" + "\n".join(f"  - {issue}" for issue in issues)
+
+
+# Таблица диспетчеризации команд: один dict-поиск вместо цепочки
+# строковых сравнений
+COMMAND_HANDLERS = {
+    "view": _cmd_view,
+    "add": _cmd_add,
+    "edit": _cmd_edit,
+    "delete": _cmd_delete,
+    "move": _cmd_move,
+    "status": _cmd_status,
+    "set-progress": _cmd_set_progress,
+    "rewrite": _cmd_rewrite,
+    "tag": _cmd_tag,
+    "alias": _cmd_alias,
+    "search": _cmd_search,
+    "path": _cmd_path,
+    "next": _cmd_next,
+    "history": _cmd_history,
+    "stats": _cmd_stats,
+    "import": _cmd_import,
+    "export": _cmd_export,
+    "backup": _cmd_backup,
+    "rollback": _cmd_rollback,
+    "clear": _cmd_clear,
+    "verify": _cmd_verify,
+}
+
+
 def execute_command(driver: HBTDriver, args: argparse.Namespace) -> Optional[str]:
     """Выполняет команду и возвращает результат"""
-    
-    if args.command == "view":
-        nodes = None
-        if args.id:
-            target = driver._find_node(args.id)
-            nodes = [target]
-        
-        tree = driver.get_text_tree(
-            nodes=nodes,
-            max_depth=args.depth,
-            use_colors=not args.raw,
-            show_hidden=args.all,
-            filter_tags=args.tags,
-            filter_progress=args.progress
-        )
-        return "\n".join(tree) if tree else "📭 Дерево пусто"
-    
-    elif args.command == "add":
-        parent = args.to if args.to != "root" else None
-        return driver.add_node(
-            parent_id=parent,
-            text=args.text,
-            is_locked=args.locked,
-            tags=args.tags,
-            alias=args.alias
-        )
-    
-    elif args.command == "edit":
-        return driver.edit_node(args.id, args.text)
-    
-    elif args.command == "delete":
-        return driver.delete_node(args.id, force=args.force)
-    
-    elif args.command == "move":
-        return driver.move_node(args.id, args.to)
-    
-    elif args.command == "status":
-        return driver.set_status(args.id, args.mode, args.recursive)
-    
-    elif args.command == "set-progress":
-        return driver.set_progress(args.id, args.state)
-    
-    elif args.command == "rewrite":
-        return driver.rewrite_children(args.id, args.items, force=args.force)
-    
-    elif args.command == "tag":
-        results = []
-        if args.add:
-            for tag in args.add:
-                results.append(driver.add_tag(args.id, tag))
-        if args.remove:
-            for tag in args.remove:
-                results.append(driver.remove_tag(args.id, tag))
-        return "\n".join(results) if results else "⚠️ Укажите --add или --remove"
-    
-    elif args.command == "alias":
-        return driver.set_alias(args.id, args.name)
-    
-    elif args.command == "search":
-        results = driver.search(args.query, include_hidden=args.all, tags=args.tags)
-        if not results:
-            return "🔍 Ничего не найдено"
-        
-        lines = []
-        for r in results:
-            alias_part = f" @{r['alias']}" if r['alias'] else ""
-            tags_part = f" #{' #'.join(r['tags'])}" if r['tags'] else ""
-            lines.append(f"{r['id'][:8]}{alias_part} — {r['text']}{tags_part}")
-        return "\n".join(lines)
-    
-    elif args.command == "path":
-        return driver.get_path(args.id)
-    
-    elif args.command == "next":
-        return driver.get_next()
-    
-    elif args.command == "history":
-        history = driver.data.get("history", [])[-args.limit:]
-        if not history:
-            return "📜 История пуста"
-        
-        lines = []
-        for entry in history:
-            checksum = entry.get('checksum', '')[:6]
-            node_id = entry.get('node_id', entry.get('id', 'unknown'))  # Совместимость со старым форматом
-            lines.append(f"[{entry['timestamp']}] {checksum} {entry['action'].upper()} {node_id[:8]} — {entry['text']}")
-        return "\n".join(lines)
-    
-    elif args.command == "stats":
-        s = driver.get_stats()
-        
-        lines = [
-            "📊 Статистика проекта:",
-            f"  Всего узлов: {s['total']}",
-            f"  ├── Видимых: {s['visible']}",
-            f"  └── Скрытых: {s['hidden']}",
-            f"  Заблокировано 🔒: {s['locked']}",
-            f"  Редактируемых ✍️: {s['editable']}",
-            "",
-            "  Прогресс:",
-        ]
-        
-        for progress, count in s['by_progress'].items():
-            icon = PROGRESS_ICONS.get(TaskProgress(progress), "⚪")
-            lines.append(f"    {icon} {progress}: {count}")
-        
-        if s['tags']:
-            lines.append("")
-            lines.append("  Топ тегов:")
-            for tag, count in sorted(s['tags'].items(), key=lambda x: -x[1])[:5]:
-                lines.append(f"    #{tag}: {count}")
-        
-        return "\n".join(lines)
-    
-    elif args.command == "import":
-        parent = args.to if args.to != "root" else None
-        return driver.import_tasks(parent, args.file)
-    
-    elif args.command == "export":
-        return driver.export_tree(args.file, use_colors=False)
-    
-    elif args.command == "backup":
-        name = f"manual_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        driver._create_snapshot(name)
-        return f"💾 Создан ручной снимок: {name}"
-    
-    elif args.command == "rollback":
-        if args.restore:
-            return driver.restore_snapshot(args.restore)
-        
-        snaps = driver.get_snapshots()
-        if not snaps:
-            return "📜 Нет доступных снапшотов"
-        
-        lines = ["📜 Доступные точки восстановления:"]
-        for snap in snaps[-20:]:  # Последние 20
-            lines.append(f"  - {snap}")
-        return "\n".join(lines)
-    
-    elif args.command == "clear":
-        if not args.yes:
-            confirm = input("⚠️ Вы уверены, что хотите очистить ВСЕ данные? (y/n): ")
-            if confirm.lower() != 'y':
-                return "❌ Отменено"
-        return driver.clear_all(confirm=True)
-    
-    elif args.command == "verify":
-        issues = driver.verify_integrity()
-        if not issues:
-            return "✅ Целостность данных в порядке"
-        return "⚠️ Обнаружены проблемы:\n" + "\n".join(f"  - {issue}" for issue in issues)
-    
-    return None
+    handler = COMMAND_HANDLERS.get(args.command)
+    if handler is None:
+        return None
+    return handler(driver, args)
 
 
 if __name__ == "__main__":
@@ -5,18 +5,30 @@
 
 Запуск: python3 test_hbt.py
 Или:    python3 -m pytest test_hbt.py -v
+Или:    python3 -m pytest -n auto test_hbt.py  (с pytest-xdist; тесты
+        изолированы по временным директориям и параллелятся свободно)
+
+HBT_FAILFAST=1 — остановиться на первом провале/ошибке (быстрая обратная
+связь при сломанном рефакторинге).
 
 Copyright (c) 2026 Максим Кузьминский (Maxim Kuzminsky)
 Email: i@m-letto.ru
 """
 
+import functools
+import hashlib
+import multiprocessing
+import sys
 import unittest
 import tempfile
-import shutil
 import os
 import json
 from pathlib import Path
 
+# Тестам не нужна долговечность при сбое питания — отключаем fsync
+# до импорта hbt (флаг читается один раз при загрузке модуля)
+os.environ.setdefault("HBT_SKIP_FSYNC", "1")
+
 # Импортируем тестируемый модуль
 from hbt import (
     HBTDriver,
@@ -30,6 +42,38 @@ from hbt import (
     IntegrityError,
     __version__
 )
+import hbt
+
+
+def _fast_rmtree(path: str) -> None:
+    """Удаляет тестовую директорию плоским os.scandir-обходом.
+
+    Тестовые директории мелкие (tasks.json, .hbt_history/*, экспорт) —
+    рекурсия и символьные проверки shutil.rmtree здесь лишние.
+    """
+    stack = [path]
+    dirs = []
+    while stack:
+        d = stack.pop()
+        dirs.append(d)
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        try:
+                            os.unlink(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            pass
+    # Сами директории удаляются снизу вверх — дети раньше родителей
+    for d in reversed(dirs):
+        try:
+            os.rmdir(d)
+        except OSError:
+            pass
 
 
 class TestHBTBase(unittest.TestCase):
@@ -37,19 +81,39 @@ class TestHBTBase(unittest.TestCase):
     
     def setUp(self):
         """Создаём временную директорию для каждого теста"""
-        self.test_dir = tempfile.mkdtemp()
+        # TemporaryDirectory вместо ручной пары mkdtemp/rmtree: финализатор
+        # удалит директорию, даже если tearDown не выполнится
+        self._tmpctx = tempfile.TemporaryDirectory(
+            ignore_cleanup_errors=True,
+            dir=os.environ.get("HBT_TEST_DIR"),
+        )
+        self.test_dir = self._tmpctx.name
         self.original_dir = os.getcwd()
         os.chdir(self.test_dir)
-        
+        # Path-объекты строятся один раз на тест, а не в каждом assert
+        self.test_path = Path(self.test_dir)
+        self.history_path = self.test_path / ".hbt_history"
+
     def tearDown(self):
         """Очищаем временную директорию после теста"""
         os.chdir(self.original_dir)
-        shutil.rmtree(self.test_dir, ignore_errors=True)
+        # Основную работу делает плоский scandir-обход; cleanup после него
+        # лишь снимает финализатор (директории уже нет)
+        _fast_rmtree(self.test_dir)
+        self._tmpctx.cleanup()
     
     def create_driver(self) -> HBTDriver:
         """Создаёт новый экземпляр драйвера"""
         return HBTDriver()
 
+    # Маркеры строятся один раз на класс, а не литералом в каждом assert
+    _SUCCESS = "✅"
+    _DOC = "📄"
+
+    def assertSuccess(self, result: str) -> None:
+        """Проверяет, что ответ драйвера содержит маркер успеха ✅"""
+        self.assertIn(self._SUCCESS, result)
+
 
 class TestNodeModel(unittest.TestCase):
     """Тесты модели Node"""
@@ -157,7 +221,7 @@ class TestAddNode(TestHBTBase):
         """Тест добавления дочернего узла"""
         driver = self.create_driver()
         driver.add_node(None, "Parent")
-        parent_id = list(driver._index.keys())[0]
+        parent_id = next(iter(driver._index))
         
         driver.add_node(parent_id, "Child")
         self.assertEqual(len(driver._index), 2)
@@ -179,7 +243,7 @@ class TestAddNode(TestHBTBase):
         driver = self.create_driver()
         driver.add_node(None, "Task", tags=["tag1", "tag2"])
         
-        node = list(driver._index.values())[0]
+        node = next(iter(driver._index.values()))
         self.assertEqual(node.tags, ["tag1", "tag2"])
     
     def test_add_locked_node(self):
@@ -188,7 +252,7 @@ class TestAddNode(TestHBTBase):
         result = driver.add_node(None, "Locked task", is_locked=True)
         
         self.assertIn("[L]", result)
-        node = list(driver._index.values())[0]
+        node = next(iter(driver._index.values()))
         self.assertTrue(node.is_locked())
     
     def test_add_node_empty_text_fails(self):
@@ -201,6 +265,33 @@ class TestAddNode(TestHBTBase):
         with self.assertRaises(ValidationError):
             driver.add_node(None, "   ")
     
+    def test_add_nodes_bulk(self):
+        """Тест пакетного добавления узлов"""
+        driver = self.create_driver()
+        result = driver.add_nodes_bulk([
+            (None, "Root", {"alias": "root"}),
+            ("root", "Child 1"),
+            ("root", "Child 2", {"tags": ["x"], "is_locked": True}),
+        ])
+
+        self.assertSuccess(result)
+        self.assertIn("3", result)
+        root = driver._find_node("root")
+        self.assertEqual(len(root.children), 2)
+        self.assertEqual(root.children[1].tags, ["x"])
+        self.assertTrue(root.children[1].is_locked())
+
+        # Все узлы сохранены одним дампом и переживают перезапуск
+        driver2 = self.create_driver()
+        self.assertEqual(len(driver2._index), 3)
+
+    def test_add_nodes_bulk_invalid_text_fails(self):
+        """Тест: пустой текст в пакете вызывает ошибку"""
+        driver = self.create_driver()
+
+        with self.assertRaises(ValidationError):
+            driver.add_nodes_bulk([(None, "Ok"), (None, "   ")])
+
     def test_add_node_duplicate_alias_fails(self):
         """Тест: дублирующийся alias вызывает ошибку"""
         driver = self.create_driver()
@@ -220,7 +311,7 @@ class TestEditNode(TestHBTBase):
         
         result = driver.edit_node("task", "New text")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("task")
         self.assertEqual(node.text, "New text")
     
@@ -251,7 +342,7 @@ class TestDeleteNode(TestHBTBase):
         
         result = driver.delete_node("task")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("task")
         self.assertFalse(node.visible)
     
@@ -270,7 +361,7 @@ class TestDeleteNode(TestHBTBase):
         
         result = driver.delete_node("task", force=True)
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("task")
         self.assertFalse(node.visible)
     
@@ -294,7 +385,7 @@ class TestStatusAndProgress(TestHBTBase):
         
         result = driver.set_status("task", "locked")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("task")
         self.assertTrue(node.is_locked())
     
@@ -319,7 +410,7 @@ class TestStatusAndProgress(TestHBTBase):
         
         for progress in ["todo", "doing", "done", "blocked"]:
             result = driver.set_progress("task", progress)
-            self.assertIn("✅", result)
+            self.assertSuccess(result)
             node = driver._find_node("task")
             self.assertEqual(node.progress, progress)
     
@@ -339,12 +430,11 @@ class TestRewrite(TestHBTBase):
         """Тест перезаписи дочерних узлов"""
         driver = self.create_driver()
         driver.add_node(None, "Parent", alias="parent")
-        driver.add_node("parent", "Old child 1")
-        driver.add_node("parent", "Old child 2")
+        driver.add_nodes_bulk([("parent", "Old child 1"), ("parent", "Old child 2")])
         
         result = driver.rewrite_children("parent", ["New 1", "New 2", "New 3"])
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         self.assertIn("3 шт", result)
         
         parent = driver._find_node("parent")
@@ -381,7 +471,7 @@ class TestMoveNode(TestHBTBase):
         
         result = driver.move_node("child", "p2")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         
         p1 = driver._find_node("p1")
         p2 = driver._find_node("p2")
@@ -419,7 +509,7 @@ class TestTagsAndAlias(TestHBTBase):
         
         result = driver.add_tag("task", "important")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("task")
         self.assertIn("important", node.tags)
     
@@ -430,7 +520,7 @@ class TestTagsAndAlias(TestHBTBase):
         
         result = driver.remove_tag("task", "tag1")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("task")
         self.assertNotIn("tag1", node.tags)
         self.assertIn("tag2", node.tags)
@@ -439,11 +529,11 @@ class TestTagsAndAlias(TestHBTBase):
         """Тест установки alias"""
         driver = self.create_driver()
         driver.add_node(None, "Task")
-        node_id = list(driver._index.keys())[0]
+        node_id = next(iter(driver._index))
         
         result = driver.set_alias(node_id, "newalias")
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         node = driver._find_node("newalias")
         self.assertEqual(node.alias, "newalias")
     
@@ -482,6 +572,15 @@ class TestSearch(TestHBTBase):
         
         self.assertEqual(len(results), 2)
     
+    def test_search_limit(self):
+        """Тест ограничения числа результатов"""
+        driver = self.create_driver()
+        for i in range(5):
+            driver.add_node(None, f"Task {i}")
+
+        self.assertEqual(len(driver.search("task", limit=2)), 2)
+        self.assertEqual(len(driver.search("task")), 5)
+
     def test_search_hidden_nodes(self):
         """Тест поиска скрытых узлов"""
         driver = self.create_driver()
@@ -586,7 +685,7 @@ class TestBackupAndRestore(TestHBTBase):
         snap_name = driver._create_snapshot("test_snap.json")
         
         self.assertEqual(snap_name, "test_snap.json")
-        self.assertTrue((Path(self.test_dir) / ".hbt_history" / "test_snap.json").exists())
+        self.assertTrue((self.history_path / "test_snap.json").exists())
     
     def test_get_snapshots(self):
         """Тест получения списка снапшотов"""
@@ -601,6 +700,84 @@ class TestBackupAndRestore(TestHBTBase):
         self.assertIn("snap1.json", snaps)
         self.assertIn("snap2.json", snaps)
     
+    def test_auto_snapshot_throttled(self):
+        """Тест: автоснапшот не создаётся на каждую операцию подряд"""
+        driver = self.create_driver()
+        driver.add_node(None, "First")  # первый сброс взводит троттлинг
+
+        snaps_before = set(os.listdir(self.history_path))
+        for i in range(5):  # меньше snap_every_n и внутри snap_interval_s
+            driver.add_node(None, f"Task {i}")
+
+        self.assertEqual(set(os.listdir(self.history_path)), snaps_before)
+
+    def test_manual_snapshot_matches_db_bytes(self):
+        """Тест: ручной снапшот побайтово совпадает с базой"""
+        driver = self.create_driver()
+        driver.add_node(None, "Task")
+
+        driver._create_snapshot("copy.json")
+
+        db_bytes = (self.test_path / "tasks.json").read_bytes()
+        self.assertEqual((self.history_path / "copy.json").read_bytes(),
+                         db_bytes)
+
+    def test_manual_snapshot_immutable_after_edits(self):
+        """Тест: снапшот не меняется от последующих правок базы
+
+        База пишется во временный файл и подменяется rename — жёсткая
+        ссылка снапшота продолжает указывать на старые байты.
+        """
+        driver = self.create_driver()
+        driver.add_node(None, "Before", alias="task")
+        driver._create_snapshot("frozen.json")
+        before = (self.history_path / "frozen.json").read_bytes()
+
+        driver.edit_node("task", "After")
+
+        self.assertEqual((self.history_path / "frozen.json").read_bytes(),
+                         before)
+
+    def test_auto_snapshot_gzip(self):
+        """Тест: автоматические снапшоты пишутся сжатыми"""
+        driver = self.create_driver()
+        driver.add_node(None, "Task")
+
+        snap_name = driver._create_snapshot(None)
+
+        self.assertTrue(snap_name.startswith("auto_"))
+        self.assertTrue(snap_name.endswith(".json.gz"))
+        self.assertTrue((self.history_path / snap_name).exists())
+
+    def test_restore_gzip_snapshot(self):
+        """Тест восстановления из сжатого снапшота"""
+        driver = self.create_driver()
+        driver.add_node(None, "Original", alias="task")
+        snap_name = driver._create_snapshot(None)
+
+        driver.edit_node("task", "Modified")
+        driver.restore_snapshot(snap_name)
+
+        self.assertEqual(driver._find_node("task").text, "Original")
+
+    def test_gzip_restore_preserves_pre_restore_backup(self):
+        """Тест: восстановление из .gz не портит hardlink-бэкап pre_restore"""
+        driver = self.create_driver()
+        driver.add_node(None, "Original", alias="task")
+        snap_name = driver._create_snapshot(None)
+
+        driver.edit_node("task", "Modified")
+        driver.restore_snapshot(snap_name)
+
+        backups = list(driver.snap_dir.glob("pre_restore_*.json"))
+        self.assertEqual(len(backups), 1)
+        # Бэкап хранит состояние ДО восстановления и живёт на своём inode
+        backup_data = json.loads(backups[0].read_text(encoding="utf-8"))
+        texts = [n["text"] for n in backup_data["tree"]]
+        self.assertIn("Modified", texts)
+        self.assertNotEqual(backups[0].stat().st_ino,
+                            (self.test_path / "tasks.json").stat().st_ino)
+
     def test_restore_snapshot(self):
         """Тест восстановления из снапшота"""
         driver = self.create_driver()
@@ -646,7 +823,7 @@ class TestClearAll(TestHBTBase):
         
         result = driver.clear_all(confirm=True)
         
-        self.assertIn("✅", result)
+        self.assertSuccess(result)
         self.assertEqual(len(driver._index), 0)
 
 
@@ -658,7 +835,7 @@ class TestImportExport(TestHBTBase):
         driver = self.create_driver()
         
         # Создаём файл для импорта
-        import_file = Path(self.test_dir) / "import.txt"
+        import_file = self.test_path / "import.txt"
         import_file.write_text("Task 1\nTask 2\nTask 3\n")
         
         result = driver.import_tasks(None, str(import_file))
@@ -672,11 +849,12 @@ class TestImportExport(TestHBTBase):
         driver.add_node(None, "Root task", alias="root")
         driver.add_node("root", "Child task")
         
-        export_file = Path(self.test_dir) / "export.txt"
+        export_file = self.test_path / "export.txt"
         result = driver.export_tree(str(export_file))
         
-        # Проверяем что результат содержит либо ✅ либо 📄
-        self.assertTrue("✅" in result or "📄" in result)
+        # Проверяем что результат содержит либо ✅ либо 📄 — экспорт
+        # отвечает документным маркером, обычный assertSuccess здесь узок
+        self.assertTrue(self._SUCCESS in result or self._DOC in result)
         self.assertTrue(export_file.exists())
         
         content = export_file.read_text()
@@ -767,7 +945,7 @@ class TestResolveId(TestHBTBase):
         """Тест разрешения по ID"""
         driver = self.create_driver()
         driver.add_node(None, "Task")
-        node_id = list(driver._index.keys())[0]
+        node_id = next(iter(driver._index))
         
         resolved = driver._resolve_id(node_id)
         
@@ -777,7 +955,7 @@ class TestResolveId(TestHBTBase):
         """Тест разрешения по alias"""
         driver = self.create_driver()
         driver.add_node(None, "Task", alias="mytask")
-        node_id = list(driver._index.keys())[0]
+        node_id = next(iter(driver._index))
         
         resolved = driver._resolve_id("mytask")
         
@@ -787,7 +965,7 @@ class TestResolveId(TestHBTBase):
         """Тест разрешения с префиксом @"""
         driver = self.create_driver()
         driver.add_node(None, "Task", alias="mytask")
-        node_id = list(driver._index.keys())[0]
+        node_id = next(iter(driver._index))
         
         resolved = driver._resolve_id("@mytask")
         
@@ -812,87 +990,377 @@ class TestFilePersistence(TestHBTBase):
         """Тест создания файла tasks.json"""
         driver = self.create_driver()
         driver.add_node(None, "Task")
-        
-        self.assertTrue((Path(self.test_dir) / "tasks.json").exists())
+
+        self.assertTrue((self.test_path / "tasks.json").exists())
+
+    def test_deep_tree_roundtrip_without_orjson(self):
+        """Тест: глубокое дерево сохраняется и читается stdlib-кодеком"""
+        driver = self.create_driver()
+        parent_id = None
+        for i in range(600):
+            parent_id = driver._insert_node(parent_id, f"n{i}",
+                                            False, None, None).id
+        driver._save()
+
+        orig, hbt.orjson = hbt.orjson, None
+        try:
+            driver2 = self.create_driver()
+            self.assertEqual(len(driver2._index), 600)
+        finally:
+            hbt.orjson = orig
+
+
+class TestBatch(TestHBTBase):
+    """Тесты группировки операций batch()"""
+
+    def test_batch_defers_flush(self):
+        """Тест: внутри batch-блока на диск не пишется, на выходе — один раз"""
+        driver = self.create_driver()
+        db_file = self.test_path / "tasks.json"
+
+        with driver.batch():
+            driver.add_node(None, "A", alias="a")
+            driver.add_node("a", "B")
+            self.assertFalse(db_file.exists())
+
+        self.assertTrue(db_file.exists())
+        driver2 = self.create_driver()
+        self.assertEqual(len(driver2._index), 2)
+
+    def test_batch_nested(self):
+        """Тест: вложенные batch-блоки сбрасывают только на внешнем выходе"""
+        driver = self.create_driver()
+        db_file = self.test_path / "tasks.json"
+
+        with driver.batch():
+            driver.add_node(None, "A")
+            with driver.batch():
+                driver.add_node(None, "B")
+            self.assertFalse(db_file.exists())
+
+        driver2 = self.create_driver()
+        self.assertEqual(len(driver2._index), 2)
+
+    def test_close_releases_history_handle(self):
+        """Тест: close() закрывает дескриптор истории и сбрасывает данные"""
+        driver = self.create_driver()
+        with driver.batch():
+            driver.add_node(None, "A")
+            driver.close()
+        self.assertIsNone(driver._hist_fp)
+        # close() дописал несохранённое, несмотря на открытый batch-блок
+        driver2 = self.create_driver()
+        self.assertEqual(len(driver2._index), 1)
+
+
+class TestHistory(TestHBTBase):
+    """Тесты журнала истории (NDJSON-файл рядом с базой)"""
+
+    def test_history_sidecar_created(self):
+        """Тест: операции пишутся построчно в tasks.history.jsonl"""
+        driver = self.create_driver()
+        driver.add_node(None, "Task")
+
+        hist_file = self.test_path / "tasks.history.jsonl"
+        self.assertTrue(hist_file.exists())
+        lines = hist_file.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(json.loads(lines[0])["action"], "add")
+
+    def test_get_history_order(self):
+        """Тест: история возвращается в порядке записи"""
+        driver = self.create_driver()
+        driver.add_node(None, "A", alias="a")
+        driver.edit_node("a", "B")
+
+        history = driver.get_history()
+        self.assertEqual([e["action"] for e in history], ["add", "edit"])
+
+    def test_history_checksums_chain(self):
+        """Тест: контрольная сумма записи включает хэш предыдущей"""
+        driver = self.create_driver()
+        driver.add_node(None, "A", alias="a")
+        driver.edit_node("a", "B")
+
+        prev = ""
+        for entry in driver.get_history():
+            expected = hashlib.blake2b(
+                f"{prev}{entry['action']}{entry['node_id']}{entry['text']}".encode(),
+                digest_size=6,
+            ).hexdigest()
+            self.assertEqual(entry["checksum"], expected)
+            prev = entry["checksum"]
+
+    def test_history_chain_survives_restore(self):
+        """Тест: цепочка сумм не рвётся после восстановления из снапшота"""
+        driver = self.create_driver()
+        driver.add_node(None, "A", alias="a")
+        snap_name = driver._create_snapshot("chain.json")
+        driver.edit_node("a", "B")
+
+        driver.restore_snapshot("chain.json")
+
+        # Запись RESTORE должна сцепляться с EDIT, а не с хвостом снапшота
+        prev = ""
+        for entry in driver.get_history():
+            expected = hashlib.blake2b(
+                f"{prev}{entry['action']}{entry['node_id']}{entry['text']}".encode(),
+                digest_size=6,
+            ).hexdigest()
+            self.assertEqual(entry["checksum"], expected)
+            prev = entry["checksum"]
+        self.assertEqual(driver._last_checksum, prev)
+
+    def test_history_chain_survives_restart(self):
+        """Тест: хвост цепочки переживает перезапуск и продолжается"""
+        driver = self.create_driver()
+        driver.add_node(None, "A")
+        tail = driver.get_history()[-1]["checksum"]
+        driver.close()
+
+        driver2 = self.create_driver()
+        driver2.add_node(None, "B")
+        entry = driver2.get_history()[-1]
+        expected = hashlib.blake2b(
+            f"{tail}{entry['action']}{entry['node_id']}{entry['text']}".encode(),
+            digest_size=6,
+        ).hexdigest()
+        self.assertEqual(entry["checksum"], expected)
+
+    def test_get_history_limit_returns_tail(self):
+        """Тест: limit отдаёт последние записи, а не первые"""
+        driver = self.create_driver()
+        with driver.batch():
+            for i in range(10):
+                driver.add_node(None, f"Task {i}")
+
+        tail = driver.get_history(limit=3)
+        self.assertEqual(len(tail), 3)
+        self.assertEqual([e["text"] for e in tail],
+                         ["Task 7", "Task 8", "Task 9"])
+
+    def test_get_history_limit_larger_than_log(self):
+        """Тест: limit больше размера журнала возвращает всё"""
+        driver = self.create_driver()
+        driver.add_node(None, "Only")
+
+        self.assertEqual(len(driver.get_history(limit=100)), 1)
+        self.assertEqual(driver.get_history(), driver.get_history(limit=100))
+
+    def test_legacy_history_migrates_once(self):
+        """Тест: встроенная история переносится в сайдкар ровно один раз"""
+        legacy = {
+            "config": {},
+            "tree": [],
+            "schema_version": "1.0.0",
+            "history": [{
+                "timestamp": "2026-01-01 00:00:00",
+                "action": "add",
+                "node_id": "x",
+                "text": "y",
+                "checksum": "c",
+            }],
+        }
+        (self.test_path / "tasks.json").write_text(
+            json.dumps(legacy), encoding="utf-8"
+        )
+
+        # Повторные загрузки не должны дублировать перенесённые записи
+        for _ in range(3):
+            self.create_driver().close()
+
+        driver = self.create_driver()
+        self.assertEqual(len(driver.get_history()), 1)
+        saved = json.loads(
+            (self.test_path / "tasks.json").read_text(encoding="utf-8")
+        )
+        self.assertNotIn("history", saved)
 
 
 # ============================================================================
 # ЗАПУСК ТЕСТОВ
 # ============================================================================
 
-def run_tests():
+# Кортеж собирается один раз при импорте — run_tests не перестраивает
+# список классов на каждый вызов
+_TEST_CLASSES = (
+    TestNodeModel,
+    TestHBTDriverBasic,
+    TestAddNode,
+    TestEditNode,
+    TestDeleteNode,
+    TestStatusAndProgress,
+    TestRewrite,
+    TestMoveNode,
+    TestTagsAndAlias,
+    TestSearch,
+    TestNavigation,
+    TestStats,
+    TestBackupAndRestore,
+    TestVerifyIntegrity,
+    TestClearAll,
+    TestImportExport,
+    TestTextTree,
+    TestNodeNotFound,
+    TestResolveId,
+    TestFilePersistence,
+    TestBatch,
+    TestHistory,
+)
+
+
+def _run_one(class_name: str):
+    """Прогоняет один тестовый класс — задание для воркера пула процессов.
+
+    Принимает и возвращает только picklable-значения: имя класса на входе,
+    (кол-во тестов, строки провалов, строки ошибок) на выходе.
+    """
+    cls = getattr(sys.modules[__name__], class_name)
+    suite = unittest.TestLoader().loadTestsFromTestCase(cls)
+    result = unittest.TestResult()
+    suite.run(result)
+    failures = [f"{test}\n{tb}" for test, tb in result.failures]
+    errors = [f"{test}\n{tb}" for test, tb in result.errors]
+    return result.testsRun, failures, errors
+
+
+def _warmup() -> None:
+    """Прогревает sys.modules перед запуском тестов.
+
+    Первый тест не платит за отложенные импорты, а воркеры --parallel
+    fork'аются с уже тёплой таблицей импортов вместо N повторных загрузок.
+    """
+    import gzip, hashlib, io, json, pathlib, shutil  # noqa: F401
+
+
+def run_tests_pytest() -> int:
+    """Альтернативный запуск через pytest (--pytest в argv).
+
+    unittest.TestCase-классы pytest собирает нативно, переписывать тесты не
+    нужно; при установленном pytest-xdist прогон распараллеливается. pytest
+    не входит в зависимости репозитория, поэтому его отсутствие — понятное
+    сообщение, а не ImportError.
+    """
+    try:
+        import pytest
+    except ImportError:
+        sys.stderr.write("pytest не установлен — запустите без --pytest\n")
+        return 1
+
+    args = ["-x", "--tb=short", __file__]
+    try:
+        import xdist  # noqa: F401 — только проверка наличия
+        args = ["-n", "auto"] + args
+    except ImportError:
+        pass
+    return pytest.main(args)
+
+
+@functools.lru_cache(maxsize=1)
+def _build_suite(mtime: float) -> unittest.TestSuite:
+    """Собирает набор тестов (кэш по mtime модуля).
+
+    В watcher/REPL-сценариях run_tests зовут многократно — повторное
+    рефлексивное сканирование модуля не нужно, пока файл не изменился.
+    """
+    return unittest.TestLoader().loadTestsFromModule(sys.modules[__name__])
+
+
+def run_tests(parallel: bool = False):
     """Запуск всех тестов с подробным выводом"""
     print("=" * 70)
     print("HBT (Hierarchical Block Text) — Тестирование")
     print(f"Версия: {__version__}")
     print("=" * 70)
     print()
-    
-    # Создаём загрузчик тестов
-    loader = unittest.TestLoader()
-    suite = unittest.TestSuite()
-    
-    # Добавляем все тестовые классы
-    test_classes = [
-        TestNodeModel,
-        TestHBTDriverBasic,
-        TestAddNode,
-        TestEditNode,
-        TestDeleteNode,
-        TestStatusAndProgress,
-        TestRewrite,
-        TestMoveNode,
-        TestTagsAndAlias,
-        TestSearch,
-        TestNavigation,
-        TestStats,
-        TestBackupAndRestore,
-        TestVerifyIntegrity,
-        TestClearAll,
-        TestImportExport,
-        TestTextTree,
-        TestNodeNotFound,
-        TestResolveId,
-        TestFilePersistence,
+
+    _warmup()
+
+    # Тестовые директории — в tmpfs, если он есть: файлы базы не трогают
+    # блочное устройство вовсе. Явно выставленный HBT_TEST_DIR уважается
+    if "HBT_TEST_DIR" not in os.environ and os.path.isdir("/dev/shm"):
+        os.environ["HBT_TEST_DIR"] = "/dev/shm"
+
+    # Список классов нужен параллельному пути (шардирование по воркерам)
+    test_classes = _TEST_CLASSES
+
+    # Канареечный поднабор для pre-commit: инварианты те же, прогон в разы
+    # короче. Баннер — чтобы smoke-прогон не приняли за полный
+    smoke = os.environ.get("HBT_SMOKE") == "1"
+    if smoke:
+        print("⚡ SMOKE-режим (HBT_SMOKE=1): только базовый поднабор классов")
+        print()
+        test_classes = [TestHBTDriverBasic, TestAddNode, TestSearch]
+
+    if parallel:
+        # unittest-parallel/pytest-xdist в репозитории нет — классы
+        # шардируются по воркерам пула стандартной библиотеки. Тесты
+        # изолированы по временным директориям, общего состояния нет
+        jobs = max(1, (os.cpu_count() or 2) - 2)
+        with multiprocessing.Pool(jobs) as pool:
+            shard_results = pool.map(_run_one, [c.__name__ for c in test_classes])
+        tests_run = sum(r[0] for r in shard_results)
+        failures = [f for r in shard_results for f in r[1]]
+        errors = [e for r in shard_results for e in r[2]]
+    else:
+        if smoke:
+            loader = unittest.TestLoader()
+            suite = unittest.TestSuite(
+                loader.loadTestsFromTestCase(c) for c in test_classes
+            )
+        else:
+            # Одно рефлексивное сканирование модуля вместо обхода по классу
+            suite = _build_suite(os.path.getmtime(__file__))
+
+        # Запускаем тесты. buffer=True глушит stdout/stderr успешных тестов
+        # (и их синхронные flush), подробный вывод — только на терминале
+        runner = unittest.TextTestRunner(
+            verbosity=2 if sys.stdout.isatty() else 1,
+            buffer=True,
+            failfast=os.environ.get("HBT_FAILFAST") == "1",
+        )
+        result = runner.run(suite)
+        tests_run = result.testsRun
+        failures = [f"{test}\n{tb}" for test, tb in result.failures]
+        errors = [f"{test}\n{tb}" for test, tb in result.errors]
+
+    # Итоговый отчёт собирается в строку и пишется одним вызовом —
+    # вместо десятка print с отдельными write/flush
+    n_fail = len(failures)
+    n_err = len(errors)
+    ok = not (n_fail or n_err)
+    bar = "=" * 70
+    lines = [
+        "",
+        bar,
+        "ИТОГОВЫЙ ОТЧЁТ",
+        bar,
+        f"Всего тестов: {tests_run}",
+        f"✅ Успешно: {tests_run - n_fail - n_err}",
+        f"❌ Провалено: {n_fail}",
+        f"💥 Ошибок: {n_err}",
+        "",
     ]
-    
-    for test_class in test_classes:
-        tests = loader.loadTestsFromTestCase(test_class)
-        suite.addTests(tests)
-    
-    # Запускаем тесты
-    runner = unittest.TextTestRunner(verbosity=2)
-    result = runner.run(suite)
-    
-    # Итоговый отчёт
-    print()
-    print("=" * 70)
-    print("ИТОГОВЫЙ ОТЧЁТ")
-    print("=" * 70)
-    print(f"Всего тестов: {result.testsRun}")
-    print(f"✅ Успешно: {result.testsRun - len(result.failures) - len(result.errors)}")
-    print(f"❌ Провалено: {len(result.failures)}")
-    print(f"💥 Ошибок: {len(result.errors)}")
-    print()
-    
-    if result.wasSuccessful():
-        print("🎉 ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
-        print("   Код работает корректно и готов к использованию.")
+
+    if ok:
+        lines.append("🎉 ВСЕ ТЕСТЫ ПРОЙДЕНЫ УСПЕШНО!")
+        lines.append("   Код работает корректно и готов к использованию.")
     else:
-        print("⚠️  ЕСТЬ ПРОБЛЕМЫ!")
-        if result.failures:
-            print("\nПровалившиеся тесты:")
-            for test, traceback in result.failures:
-                print(f"  - {test}")
-        if result.errors:
-            print("\nТесты с ошибками:")
-            for test, traceback in result.errors:
-                print(f"  - {test}")
-    
-    print("=" * 70)
-    
-    return 0 if result.wasSuccessful() else 1
+        lines.append("⚠️  ЕСТЬ ПРОБЛЕМЫ!")
+        if failures:
+            lines.append("\nПровалившиеся тесты:")
+            lines.extend(f"  - {f.splitlines()[0]}" for f in failures)
+        if errors:
+            lines.append("\nТесты с ошибками:")
+            lines.extend(f"  - {e.splitlines()[0]}" for e in errors)
+
+    lines.append(bar)
+    sys.stdout.write("\n".join(lines) + "\n")
+
+    return 0 if ok else 1
 
 
 if __name__ == "__main__":
-    exit(run_tests())
+    if "--pytest" in sys.argv:
+        exit(run_tests_pytest())
+    exit(run_tests(parallel="--parallel" in sys.argv))